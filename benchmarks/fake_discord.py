@@ -0,0 +1,338 @@
+import asyncio
+import itertools
+from collections import Counter
+from typing import Dict, List, Optional
+
+import discord
+
+from discord_karaoke.src.karaoke_bot_config import KaraokeBotConfig
+from discord_karaoke.src.karaoke_notifier import KaraokeRateLimit
+
+_ids = itertools.count(10 ** 17)
+
+
+class FakeApi:
+    def __init__(self, latency: float = 0.0, rate: int = 0, per: float = 1.0):
+        self.latency = latency
+        self.rate = rate
+        self.per = per
+        self.calls: Counter = Counter()
+        self.limits: Dict[int, KaraokeRateLimit] = dict()
+        self.rate_limited = 0.0
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    async def call(self, method: str, route: int):
+        self.calls[method] += 1
+        if self.rate:
+            if route not in self.limits:
+                self.limits[route] = KaraokeRateLimit(self.rate, self.per)
+            self.rate_limited += await self.limits[route].acquire()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeMessage:
+    def __init__(self, api: FakeApi, channel, content: str = None, author=None):
+        self.api = api
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.author = author
+
+    async def delete(self):
+        await self.api.call('delete_message', self.channel.id)
+
+    async def edit(self, content: str = None, **kwargs):
+        await self.api.call('edit_message', self.channel.id)
+        self.content = content
+
+    async def pin(self):
+        await self.api.call('pin', self.channel.id)
+        self.channel.pinned.append(self)
+
+
+class FakeMessageable:
+    api: FakeApi
+    id: int
+
+    def __init__(self):
+        self.messages: List[FakeMessage] = []
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        await self.api.call('send', self.id)
+        guild = getattr(self, 'guild', None)
+        message = FakeMessage(self.api, self, content, author=guild.me if guild else None)
+        self.messages.append(message)
+        return message
+
+
+class FakeResponse:
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeRole:
+    def __init__(self, guild: 'FakeGuild', name: str, role_id: int = None):
+        self.id = role_id or next(_ids)
+        self.guild = guild
+        self.name = name
+        self.mention = f'<@&{self.id}>'
+
+    @property
+    def members(self) -> List['FakeMember']:
+        return [member for member in self.guild.members if self in member.roles]
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return self.id >> 22
+
+
+class FakeVoiceState:
+    def __init__(self, channel: 'FakeVoiceChannel' = None, mute: bool = False):
+        self.channel = channel
+        self.mute = mute
+
+
+class FakeMember(FakeMessageable):
+    def __init__(self, guild: 'FakeGuild', name: str):
+        super().__init__()
+        self.api = guild.api
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.mention = f'<@{self.id}>'
+        self.roles: List[FakeRole] = [guild.default_role]
+        # Roles on Discord's side, the cached roles only follow them with GUILD_MEMBER_UPDATE of the members intent
+        self.server_roles: List[FakeRole] = list(self.roles)
+        self.voice: Optional[FakeVoiceState] = None
+        self.bot = False
+        self._user = self
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return self.id >> 22
+
+    async def edit(self, mute: bool = None, **kwargs):
+        await self.api.call('edit_member', self.guild.id)
+        if mute is not None and self.voice:
+            self.voice.mute = mute
+
+    async def add_roles(self, *roles: FakeRole, **kwargs):
+        await self.api.call('add_roles', self.guild.id)
+        self.server_roles += [role for role in roles if role not in self.server_roles]
+
+    async def remove_roles(self, *roles: FakeRole, **kwargs):
+        await self.api.call('remove_roles', self.guild.id)
+        self.server_roles = [role for role in self.server_roles if role not in roles]
+
+
+class FakeGuildChannel:
+    def __init__(self, guild: 'FakeGuild', name: str, category=None, overwrites: dict = None):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.overwrites = dict(overwrites or {})
+        self.mention = f'<#{self.id}>'
+
+    async def edit(self, category=None, overwrites: dict = None, **kwargs):
+        await self.guild.api.call('edit_channel', self.id)
+        self.category = category or self.category
+        self.overwrites = dict(overwrites) if overwrites is not None else self.overwrites
+
+    async def delete(self):
+        await self.guild.api.call('delete_channel', self.id)
+        self.guild.remove(self)
+
+
+class FakeCategory(FakeGuildChannel):
+    pass
+
+
+class FakeTextChannel(FakeGuildChannel, FakeMessageable):
+    def __init__(self, guild: 'FakeGuild', name: str, category=None, overwrites: dict = None):
+        FakeGuildChannel.__init__(self, guild, name, category, overwrites)
+        FakeMessageable.__init__(self)
+        self.api = guild.api
+        self.pinned: List[FakeMessage] = []
+
+    async def pins(self) -> List[FakeMessage]:
+        await self.api.call('pins', self.id)
+        return list(reversed(self.pinned))
+
+
+class FakeVoiceChannel(FakeGuildChannel):
+    @property
+    def members(self) -> List[FakeMember]:
+        return [member for member in self.guild.members if member.voice and member.voice.channel is self]
+
+
+class FakeDMChannel(discord.DMChannel):
+    def __init__(self, api: FakeApi, recipient: FakeMember):
+        self.api = api
+        self.id = next(_ids)
+        self.recipient = recipient
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        await self.api.call('send', self.recipient.id)
+        return FakeMessage(self.api, self, content)
+
+
+class FakeGuild:
+    def __init__(self, api: FakeApi, guild_id: int):
+        self.api = api
+        self.id = guild_id
+        self.default_role = FakeRole(self, '@everyone', guild_id)
+        self.roles: List[FakeRole] = [self.default_role]
+        self.channels: List[FakeGuildChannel] = []
+        self.members: List[FakeMember] = []
+        self.chunked = True
+        self.__index: Dict[int, object] = {guild_id: self.default_role}
+        # The bot itself, not listed among the members
+        self.me = FakeMember(self, 'karaoke')
+        self.me.bot = True
+
+    @property
+    def text_channels(self) -> List[FakeTextChannel]:
+        return [channel for channel in self.channels if isinstance(channel, FakeTextChannel)]
+
+    @property
+    def voice_channels(self) -> List[FakeVoiceChannel]:
+        return [channel for channel in self.channels if isinstance(channel, FakeVoiceChannel)]
+
+    @property
+    def categories(self) -> List[FakeCategory]:
+        return [channel for channel in self.channels if isinstance(channel, FakeCategory)]
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        entity = self.__index.get(role_id)
+        return entity if isinstance(entity, FakeRole) else None
+
+    def get_channel(self, channel_id: int) -> Optional[FakeGuildChannel]:
+        entity = self.__index.get(channel_id)
+        return entity if isinstance(entity, FakeGuildChannel) else None
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        entity = self.__index.get(member_id)
+        return entity if isinstance(entity, FakeMember) else None
+
+    async def fetch_member(self, member_id: int) -> FakeMember:
+        await self.api.call('fetch_member', self.id)
+        member = self.get_member(member_id)
+        if not member:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown Member')
+        return member
+
+    def add(self, entity):
+        self.__index[entity.id] = entity
+        if isinstance(entity, FakeRole):
+            self.roles.append(entity)
+        elif isinstance(entity, FakeMember):
+            self.members.append(entity)
+        else:
+            self.channels.append(entity)
+        return entity
+
+    def remove(self, entity):
+        self.__index.pop(entity.id, None)
+        for collection in (self.roles, self.channels, self.members):
+            if entity in collection:
+                collection.remove(entity)
+
+    async def create_role(self, name: str, **kwargs) -> FakeRole:
+        await self.api.call('create_role', self.id)
+        return self.add(FakeRole(self, name))
+
+    async def create_category(self, name: str, overwrites: dict = None, **kwargs) -> FakeCategory:
+        await self.api.call('create_channel', self.id)
+        return self.add(FakeCategory(self, name, overwrites=overwrites))
+
+    async def create_text_channel(self, name: str, category=None, overwrites: dict = None,
+                                  **kwargs) -> FakeTextChannel:
+        await self.api.call('create_channel', self.id)
+        return self.add(FakeTextChannel(self, name, category, overwrites))
+
+    async def create_voice_channel(self, name: str, category=None, overwrites: dict = None,
+                                   **kwargs) -> FakeVoiceChannel:
+        await self.api.call('create_channel', self.id)
+        return self.add(FakeVoiceChannel(self, name, category, overwrites))
+
+
+class FakeContext:
+    def __init__(self, author: FakeMember, channel, guild: FakeGuild = None):
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.message = FakeMessage(author.api, channel, author=author)
+
+
+class FakeBot:
+    def __init__(self, api: FakeApi):
+        self.api = api
+        self.guilds: Dict[int, FakeGuild] = dict()
+        self.intents = discord.Intents.default()
+        self.loop = None
+        # Off to look like a restart before the member cache is filled, users are only found with fetch_user
+        self.users_cached = True
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guilds.get(guild_id)
+
+    def get_user(self, user_id: int) -> Optional[FakeMember]:
+        if not self.users_cached:
+            return None
+        for guild in self.guilds.values():
+            member = guild.get_member(user_id)
+            if member:
+                return member
+        return None
+
+    async def fetch_user(self, user_id: int) -> FakeMember:
+        await self.api.call('fetch_user', user_id)
+        user = next((guild.get_member(user_id) for guild in self.guilds.values() if guild.get_member(user_id)), None)
+        if not user:
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), 'Unknown User')
+        return user
+
+
+# In-process stand-in for a guild prepared for a karaoke event
+class FakeGateway:
+    def __init__(self, config: KaraokeBotConfig, api: FakeApi = None):
+        self.config = config
+        self.api = api or FakeApi()
+        self.bot = FakeBot(self.api)
+        self.guild = self.bot.guilds[config.guild_id] = FakeGuild(self.api, config.guild_id)
+        self.admin_role = self.guild.add(FakeRole(self.guild, config.admin_role_name))
+        self.member_role = self.guild.add(FakeRole(self.guild, config.member_role_name))
+        self.category = self.guild.add(FakeCategory(self.guild, config.category_name))
+        self.text_channel = self.guild.add(FakeTextChannel(self.guild, config.text_channel_name, self.category))
+        self.voice_channel = self.guild.add(FakeVoiceChannel(self.guild, config.voice_channel_name, self.category))
+        self.dm_channels: Dict[int, FakeDMChannel] = dict()
+
+    def add_member(self, name: str, admin: bool = False) -> FakeMember:
+        member = self.guild.add(FakeMember(self.guild, name))
+        if admin:
+            member.roles.append(self.admin_role)
+            member.server_roles.append(self.admin_role)
+        return member
+
+    def move(self, member: FakeMember, channel: Optional[FakeVoiceChannel]) -> (FakeVoiceState, FakeVoiceState):
+        before = member.voice or FakeVoiceState()
+        member.voice = FakeVoiceState(channel) if channel else None
+        return before, member.voice or FakeVoiceState()
+
+    def dm(self, member: FakeMember) -> FakeContext:
+        if member.id not in self.dm_channels:
+            self.dm_channels[member.id] = FakeDMChannel(self.api, member)
+        return FakeContext(member, self.dm_channels[member.id])
+
+    def text(self, member: FakeMember) -> FakeContext:
+        return FakeContext(member, self.text_channel, self.guild)
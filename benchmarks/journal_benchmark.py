@@ -0,0 +1,86 @@
+import asyncio
+import tempfile
+import time
+
+from benchmarks.fake_discord import FakeApi, FakeGateway
+from discord_karaoke.src.karaoke_bot import KaraokeBot
+from discord_karaoke.src.karaoke_bot_config import KaraokeBotConfig
+from discord_karaoke.src.karaoke_journal import KaraokeJournal, KaraokeJournalState
+
+ENTRIES = 100000
+# Restored queue, its users are fetched from the API with the latency
+RESTORED = 1000
+LATENCY = 0.05
+
+
+def write(path: str, snapshot_every: int) -> (float, float):
+    journal = KaraokeJournal(path, snapshot_every=snapshot_every)
+    journal.recover()
+    queue = []
+    # The longest a single command waits for the journal, what it adds to command latency
+    blocked = 0.0
+
+    started_at = time.perf_counter()
+    for user_id in range(ENTRIES):
+        call_started_at = time.perf_counter()
+        journal.append('add', user_id, f'song {user_id}')
+        queue.append((user_id, f'song {user_id}'))
+        if journal.needs_snapshot:
+            journal.snapshot(KaraokeJournalState(list(queue)))
+        blocked = max(blocked, time.perf_counter() - call_started_at)
+    journal.close()
+
+    return time.perf_counter() - started_at, blocked
+
+
+def recover(path: str) -> (float, int):
+    journal = KaraokeJournal(path)
+    started_at = time.perf_counter()
+    state = journal.recover()
+    elapsed = time.perf_counter() - started_at
+    journal.close()
+
+    return elapsed, len(state.queue)
+
+
+# The whole restore of a tenant after a restart: the journal, fetching the users that are not cached yet and
+# rebuilding the queue
+async def restore(path: str) -> (float, int, int):
+    config = KaraokeBotConfig.from_config_file('./config.json')
+    config.storage_path = path
+    config.metrics_port = None
+    api = FakeApi(latency=LATENCY)
+    gateway = FakeGateway(config, api)
+    journal = KaraokeJournal(path)
+    journal.recover()
+    for index in range(RESTORED):
+        journal.append('add', gateway.add_member(f'user-{index}').id, f'song {index}', 0)
+    journal.close()
+
+    gateway.bot.users_cached = False
+    tenant = KaraokeBot(config)
+    tenant.bot = gateway.bot
+    started_at = time.perf_counter()
+    await tenant.restore()
+    elapsed = time.perf_counter() - started_at
+    tenant.journal.close()
+
+    return elapsed, len(tenant.queue), api.calls['fetch_user']
+
+
+def main():
+    for snapshot_every in (ENTRIES * 2, 10000):
+        with tempfile.TemporaryDirectory() as path:
+            elapsed, blocked = write(path, snapshot_every)
+            print(f'snapshot_every={snapshot_every:<7} write {ENTRIES / elapsed:10.0f} records/s, '
+                  f'longest call {blocked * 1000:.3f} ms')
+            elapsed, size = recover(path)
+            print(f'snapshot_every={snapshot_every:<7} recover {size} entries in {elapsed * 1000:.1f} ms')
+    with tempfile.TemporaryDirectory() as path:
+        elapsed, size, fetched = asyncio.run(restore(path))
+        print(f'restore {size} entries, {fetched} users fetched with {LATENCY * 1000:.0f} ms latency, '
+              f'in {elapsed * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
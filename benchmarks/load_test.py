@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.fake_discord import FakeApi, FakeGateway
+from discord_karaoke.src.karaoke_bot import KaraokeBot
+from discord_karaoke.src.karaoke_bot_config import KaraokeBotConfig, QUEUE_MODES, MIC_MODES
+from discord_karaoke.src.karaoke_notifier import KaraokeNotifier
+
+
+class ScenarioStats:
+    def __init__(self, api: FakeApi):
+        self.api = api
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.api_calls: Dict[str, int] = defaultdict(int)
+
+    async def measure(self, command: str, coroutine):
+        calls = self.api.total
+        started_at = time.perf_counter()
+        await coroutine
+        self.latencies[command].append(time.perf_counter() - started_at)
+        self.api_calls[command] += self.api.total - calls
+
+    def report(self, size: int, memory: int = None):
+        print(f'--- queue size {size}' + (f', traced memory peak {memory / 1024:.0f} KiB' if memory else ''))
+        for command, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            p50, p95, p99 = (latencies[min(len(latencies) - 1, int(len(latencies) * q))] for q in (0.5, 0.95, 0.99))
+            print(f'{command:>8} n={len(latencies):<6} p50={p50 * 1000:8.3f}ms p95={p95 * 1000:8.3f}ms '
+                  f'p99={p99 * 1000:8.3f}ms mean={statistics.mean(latencies) * 1000:8.3f}ms '
+                  f'api/cmd={self.api_calls[command] / len(latencies):5.2f}')
+        if self.api.rate_limited:
+            print(f'rate limited for {self.api.rate_limited:.3f}s')
+
+
+async def scenario(config_path: str, size: int, latency: float, rate: int, cycles: int,
+                   mode: str = None, mic: str = None, board: bool = False) -> ScenarioStats:
+    config = KaraokeBotConfig.from_config_file(config_path)
+    config.storage_path = None
+    config.queue_mode = mode or config.queue_mode
+    config.mic_mode = mic or config.mic_mode
+    config.board_enabled = board or config.board_enabled
+    api = FakeApi(latency=latency, rate=rate)
+    gateway = FakeGateway(config, api)
+    stats = ScenarioStats(api)
+    randomizer = random.Random(size)
+
+    tenant = KaraokeBot(config)
+    tenant.bot = gateway.bot
+    tenant.notifier = KaraokeNotifier(rate=10 ** 9, per=1)
+    await tenant.on_ready()
+
+    admin = gateway.add_member('admin', admin=True)
+    users = [gateway.add_member(f'user-{index}') for index in range(size)]
+
+    # The first run fixes the overwrites of the prepared channels, the second one has nothing to do
+    for _ in range(2):
+        await stats.measure('provision', tenant.start_karaoke(gateway.text(admin)))
+
+    for user in users:
+        before, after = gateway.move(user, gateway.voice_channel)
+        await stats.measure('join', tenant.on_voice_state_update(user, before, after))
+    await stats.measure('roles', tenant.role_sync.flush())
+
+    for user in users:
+        await stats.measure('append', tenant.add_me_to_queue(gateway.dm(user), f'song of {user.name}'))
+
+    for user in randomizer.sample(users, max(1, size // 10)):
+        await stats.measure('list', tenant.show_queue_of_artists(gateway.dm(user)))
+
+    for user in randomizer.sample(users, max(1, size // 10)):
+        await stats.measure('cancel', tenant.remove_me_from_queue(gateway.dm(user)))
+
+    for cycle in range(min(cycles, len(tenant.queue))):
+        await stats.measure('start', tenant.start_performance(gateway.text(admin)))
+        if cycle % 5 == 4 and len(tenant.queue) > 1:
+            skipped = tenant.queue.get(1).user
+            await stats.measure('skip', tenant.skip_performance(gateway.text(admin), skipped, 'no show'))
+        await stats.measure('finish', tenant.finish_performance(gateway.text(admin)))
+    if config.board_enabled:
+        await stats.measure('board', tenant.board.flush())
+
+    for user in users:
+        before, after = gateway.move(user, None)
+        await stats.measure('leave', tenant.on_voice_state_update(user, before, after))
+    await stats.measure('roles', tenant.role_sync.flush())
+    await stats.measure('teardown', tenant.stop_karaoke(gateway.text(admin)))
+
+    tenant.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test of KaraokeBot against a fake Discord gateway')
+    parser.add_argument('--config', default='./config.json')
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated API latency, seconds')
+    parser.add_argument('--rate', type=int, default=0, help='simulated API calls per route per second, 0 is unlimited')
+    parser.add_argument('--cycles', type=int, default=50, help='start/finish cycles per scenario')
+    parser.add_argument('--mode', choices=QUEUE_MODES, help='queue mode, the one from the config by default')
+    parser.add_argument('--mic', choices=MIC_MODES, help='mic mode, the one from the config by default')
+    parser.add_argument('--board', action='store_true', help='show transitions on the board message')
+    parser.add_argument('--memory', action='store_true', help='trace memory allocations, slows the run down')
+    args = parser.parse_args()
+
+    for size in map(int, args.sizes.split(',')):
+        if args.memory:
+            tracemalloc.start()
+        stats = asyncio.run(scenario(args.config, size, args.latency, args.rate, args.cycles, args.mode, args.mic,
+                                     args.board))
+        memory = None
+        if args.memory:
+            memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stats.report(size, memory)
+
+
+if __name__ == '__main__':
+    main()
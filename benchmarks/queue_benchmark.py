@@ -0,0 +1,68 @@
+import random
+import timeit
+from collections import namedtuple
+
+from discord_karaoke.src.karaoke_queue import KaraokeQueue, KaraokeFairQueue
+
+FakeUser = namedtuple('FakeUser', ['id'])
+
+
+class ListQueue:
+    def __init__(self):
+        self.queue = []
+        self.user_songs = dict()
+
+    def append(self, user, comment=None):
+        self.queue.append(user)
+        if comment:
+            self.user_songs[user.id] = comment
+        return self.queue.index(user) + 1
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __contains__(self, user):
+        return user in self.queue
+
+    def index(self, user):
+        return self.queue.index(user)
+
+    def remove(self, user):
+        self.queue.remove(user)
+        self.user_songs.pop(user.id, None)
+
+    def pop(self):
+        user = self.queue.pop(0)
+        return user, self.user_songs.pop(user.id, None)
+
+
+def scenario(queue_factory, size: int):
+    users = [FakeUser(i) for i in range(size)]
+    cancelled = random.Random(size).sample(users, size // 4)
+
+    def run():
+        queue = queue_factory()
+        for user in users:
+            queue.append(user, 'song')
+        for user in users:
+            if user in queue:
+                queue.index(user)
+        for user in cancelled:
+            queue.remove(user)
+        while len(queue):
+            queue.pop()
+
+    return run
+
+
+def main():
+    for size in (10, 100, 1000, 10000):
+        number = max(1, 10000 // size)
+        for name, factory in (('list', ListQueue), ('KaraokeQueue', KaraokeQueue),
+                              ('KaraokeFairQueue', KaraokeFairQueue)):
+            seconds = timeit.timeit(scenario(factory, size), number=number) / number
+            print(f'{name:>16} n={size:<6} {seconds * 1000:10.3f} ms/scenario')
+
+
+if __name__ == '__main__':
+    main()
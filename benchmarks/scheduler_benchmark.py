@@ -0,0 +1,45 @@
+import asyncio
+import random
+import time
+
+from discord_karaoke.src.karaoke_scheduler import KaraokeScheduler
+
+
+async def scenario(size: int):
+    scheduler = KaraokeScheduler()
+    randomizer = random.Random(size)
+    lateness = []
+
+    async def fire(at: float):
+        lateness.append(time.time() - at)
+
+    started = time.perf_counter()
+    now = time.time()
+    for key in range(size):
+        at = now + 1.0 + randomizer.random() * 0.5
+        scheduler.schedule(key, at, fire, at)
+    # Half of the timers are moved and a quarter cancelled, as leaves and rejoins would do
+    for key in randomizer.sample(range(size), size // 2):
+        at = now + 1.0 + randomizer.random() * 0.5
+        scheduler.schedule(key, at, fire, at)
+    for key in randomizer.sample(range(size), size // 4):
+        scheduler.cancel(key)
+    setup = time.perf_counter() - started
+
+    pending = len(scheduler)
+    while len(lateness) < pending:
+        await asyncio.sleep(0.05)
+    scheduler.stop()
+
+    lateness.sort()
+    print(f'n={size:<7} setup={setup * 1000:8.3f} ms heap={len(scheduler.heap):<7} '
+          f'late p50={lateness[len(lateness) // 2] * 1000:7.3f} ms max={lateness[-1] * 1000:7.3f} ms')
+
+
+def main():
+    for size in (100, 1000, 10000, 100000):
+        asyncio.run(scenario(size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import argparse
+import logging
+import os
+
+from discord_karaoke.src.karaoke_bot import KaraokeBot
+from discord_karaoke.src.karaoke_bot_config import KaraokeBotConfig, GATEWAY_PROFILES
+from discord_karaoke.src.karaoke_cluster import KaraokeCluster
+
+
+# Connects to Discord with a real token until the bot is ready and reports the startup time and the caches.
+# One profile per process, RSS of a process never goes back down.
+def main():
+    parser = argparse.ArgumentParser(description='Startup time and memory of the bot with a gateway profile')
+    parser.add_argument('--config', default='./config.json')
+    parser.add_argument('--profile', choices=GATEWAY_PROFILES,
+                        help='gateway profile, the one from the config by default')
+    parser.add_argument('--max-messages', type=int, help='messages cached by discord.py, 0 disables the cache')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    configs = KaraokeBotConfig.from_path(args.config)
+    for config in configs:
+        # The state of a running deployment is left alone
+        config.storage_path = None
+        config.metrics_port = None
+        config.gateway_profile = args.profile or config.gateway_profile
+        if args.max_messages is not None:
+            config.gateway_max_messages = args.max_messages
+
+    cluster = KaraokeCluster([KaraokeBot(config) for config in configs],
+                             sharded=any(config.sharded for config in configs))
+    cluster.run(os.environ['DISCORD_TOKEN'], measure_startup=True)
+    if cluster.startup:
+        print(f'profile={cluster.config.gateway_profile} ' + ' '.join(
+            f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}'
+            for key, value in cluster.startup.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from .src.karaoke_bot import KaraokeBot
 from .src.karaoke_bot_config import KaraokeBotConfig
+from .src.karaoke_cluster import KaraokeCluster
 
 __version__ = '0.0.5'
 __author__ = 'Артем Широких <@artemetr>'
@@ -8,3 +9,4 @@ __license__ = 'MIT'
 # For JetBrains IDE recognition
 KaraokeBot = KaraokeBot
 KaraokeBotConfig = KaraokeBotConfig
+KaraokeCluster = KaraokeCluster
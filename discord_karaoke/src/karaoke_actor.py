@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Tuple, Any, Optional, Dict
+
+from .karaoke_metrics import KaraokeMetrics
+from .karaoke_notifier import KaraokeNotification
+
+logger = logging.getLogger(__name__)
+
+
+# What a state transition wants done with Discord, computed from the state at the moment of the transition
+@dataclass(frozen=True)
+class KaraokeEffects:
+    notifications: Tuple[KaraokeNotification, ...] = ()
+    unmute: Tuple[int, ...] = ()
+    mute: Tuple[int, ...] = ()
+
+
+# Single consumer of the event state: operations are applied one by one in the order they were submitted,
+# adjacent read-only operations are applied as one batch and identical ones are computed once.
+class KaraokeActor:
+    def __init__(self, metrics: KaraokeMetrics = None, on_change: Callable[[], None] = None):
+        self.metrics = metrics
+        self.on_change = on_change
+        self.mailbox: Deque[Tuple[Callable, tuple, bool, asyncio.Future]] = deque()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.mailbox)
+
+    def start(self):
+        if not self.task:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        while self.mailbox:
+            self.mailbox.popleft()[3].cancel()
+
+    def submit(self, operation: Callable, args: tuple, read_only: bool) -> asyncio.Future:
+        self.start()
+        future = asyncio.get_event_loop().create_future()
+        self.mailbox.append((operation, args, read_only, future))
+        self.wakeup.set()
+        return future
+
+    async def apply(self, operation: Callable, *args) -> Any:
+        return await self.submit(operation, args, read_only=False)
+
+    async def read(self, operation: Callable, *args) -> Any:
+        return await self.submit(operation, args, read_only=True)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            while self.mailbox:
+                operation, args, read_only, future = self.mailbox.popleft()
+                if not read_only:
+                    self.resolve(future, self.call(operation, args))
+                    self.changed()
+                    continue
+
+                batch = [(operation, args, future)]
+                while self.mailbox and self.mailbox[0][2]:
+                    operation, args, _, future = self.mailbox.popleft()
+                    batch.append((operation, args, future))
+
+                results: Dict[Tuple[Callable, tuple], Tuple[Any, Optional[Exception]]] = dict()
+                for operation, args, future in batch:
+                    if future.done():
+                        continue
+                    key = (operation, args)
+                    try:
+                        hash(key)
+                    except TypeError:
+                        # Unhashable arguments are not coalesced
+                        self.resolve(future, self.call(operation, args))
+                        continue
+                    if key in results:
+                        if self.metrics:
+                            self.metrics.inc('karaoke_actor_coalesced_reads_total')
+                    else:
+                        results[key] = self.call(operation, args)
+                    self.resolve(future, results[key])
+
+    # A failed operation fails only its own future, the actor goes on with the next one
+    def call(self, operation: Callable, args: tuple) -> Tuple[Any, Optional[Exception]]:
+        try:
+            return operation(*args), None
+        except Exception as error:
+            logger.exception('Operation %s failed', getattr(operation, '__name__', operation))
+            if self.metrics:
+                self.metrics.inc('karaoke_actor_errors_total')
+            return None, error
+
+    def changed(self):
+        if not self.on_change:
+            return
+        try:
+            self.on_change()
+        except Exception:
+            logger.exception('State change handler failed')
+            if self.metrics:
+                self.metrics.inc('karaoke_actor_errors_total')
+
+    @staticmethod
+    def resolve(future: asyncio.Future, result: Tuple[Any, Optional[Exception]]):
+        if future.done():
+            return
+        value, error = result
+        if error:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+import discord
+from discord import Message, TextChannel
+
+from .karaoke_metrics import KaraokeMetrics
+from .karaoke_pages import MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+# One pinned message of the text channel showing the event state. Changes only mark the board dirty,
+# it is rendered from the latest state and edited at most once per interval.
+class KaraokeBoard:
+    def __init__(self, render: Callable[[], str], channel: Callable[[], Optional[TextChannel]],
+                 interval: float = 2.0, metrics: KaraokeMetrics = None):
+        self.render = render
+        self.channel = channel
+        self.interval = interval
+        self.metrics = metrics
+        self.message: Optional[Message] = None
+        self.content: Optional[str] = None
+        self.edited_at = 0.0
+        self.dirty: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def touch(self):
+        if not self.task:
+            self.dirty = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        self.dirty.set()
+        self.count('touch')
+
+    def reset(self):
+        self.message = None
+        self.content = None
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            await self.dirty.wait()
+            delay = self.edited_at + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self.dirty.clear()
+            try:
+                await self.flush()
+            except discord.HTTPException as error:
+                logger.warning('Failed to update the board: %s', error)
+                self.count('error')
+                self.reset()
+            self.edited_at = time.monotonic()
+
+    async def flush(self):
+        channel = self.channel()
+        content = self.render()[:MESSAGE_LIMIT]
+        if not channel or content == self.content:
+            self.count('skip')
+            return
+
+        if not self.message:
+            self.message = await self.find(channel)
+
+        if self.message:
+            try:
+                await self.message.edit(content=content)
+            except discord.NotFound:
+                self.message = None
+
+        if not self.message:
+            self.message = await channel.send(content)
+            await self.message.pin()
+
+        self.content = content
+        self.count('edit')
+
+    @staticmethod
+    async def find(channel: TextChannel) -> Optional[Message]:
+        # The board of the previous run, pins are listed newest first
+        me = channel.guild.me
+        return discord.utils.find(lambda message: message.author.id == me.id, await channel.pins())
+
+    def count(self, action: str):
+        if self.metrics:
+            self.metrics.inc('karaoke_board_updates_total', (('action', action),))
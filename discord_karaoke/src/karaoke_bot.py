@@ -1,117 +1,360 @@
-from typing import List, Dict
+import asyncio
+import logging
+import os
+import time
+from typing import List, Callable, Any, Optional, Tuple, Iterable, Dict
 
 import discord
 from discord import VoiceState, Member, User, Role, Guild, DMChannel
 from discord.abc import PrivateChannel, GuildChannel
-from discord.ext import commands
 from discord.ext.commands import Bot, Context
 
-from .decorators import direct_message, allowed_guilds, allowed_channels
+from .karaoke_actor import KaraokeActor, KaraokeEffects
+from .karaoke_board import KaraokeBoard
 from .karaoke_bot_config import KaraokeBotConfig
-from .karaoke_log import KaraokeLog
+from .karaoke_cache import KaraokeEntityCache
+from .karaoke_history import KaraokeHistory, KaraokeHistoryRecord, FINISHED, SKIPPED
+from .karaoke_journal import KaraokeJournal, KaraokeJournalState
+from .karaoke_metrics import KaraokeMetrics
+from .karaoke_mic import KaraokeMic
+from .karaoke_notifier import KaraokeNotifier, KaraokeNotification, KaraokeNotificationFailure
+from .karaoke_pages import KaraokePages
+from .karaoke_participants import KaraokeParticipants
+from .karaoke_provisioner import KaraokeProvisioner, find
+from .karaoke_queue import KaraokeQueue, KaraokeFairQueue
+from .karaoke_role_sync import KaraokeRoleSync
+from .karaoke_scheduler import KaraokeScheduler
+
+logger = logging.getLogger(__name__)
+
+# Users of the restored queue and role holders fetched from Discord at once
+FETCH_CONCURRENCY = 8
 
 
 class KaraokeBot:
     def __init__(self, config: KaraokeBotConfig):
         self.config = config
         self.bot: Bot = None
-        self.queue: List[User] = []
-        self.user_songs: Dict[int, str] = dict()
-        self.log: List[KaraokeLog] = []
+        self.log = KaraokeHistory(config.history_capacity, os.path.join(
+            config.storage_path, 'history.jsonl') if config.storage_path else None)
+        self.queue: KaraokeQueue or KaraokeFairQueue = self.create_queue()
+        self.performance: Optional[Tuple[int, float]] = None
+        # The artist called to be ready and the deadline to confirm it
+        self.ready_check: Optional[Tuple[int, float]] = None
+        self.metrics = KaraokeMetrics()
+        self.notifier = KaraokeNotifier(metrics=self.metrics)
+        self.actor = KaraokeActor(metrics=self.metrics, on_change=self.state_changed)
+        self.scheduler = KaraokeScheduler(metrics=self.metrics)
+        self.board = KaraokeBoard(self.render_board, lambda: self.text_channel, config.board_interval,
+                                  metrics=self.metrics)
+        self.mic = KaraokeMic(config.mic_mode, config.mic_concurrency, metrics=self.metrics)
+        self.cache = KaraokeEntityCache()
+        self.participants = KaraokeParticipants()
+        self.role_sync = KaraokeRoleSync(lambda: self.member_role, config.role_sync_delay,
+                                         config.role_sync_concurrency, metrics=self.metrics, path=os.path.join(
+                                             config.storage_path, 'roles.json') if config.storage_path else None)
+        self.queue_pages = KaraokePages(self.get_list_user_description)
+        self.log_pages = KaraokePages(self.get_list_user_description)
+        self.journal = KaraokeJournal(config.storage_path, config.storage_fsync_interval,
+                                      snapshot_every=config.storage_snapshot_every) if config.storage_path else None
+
+    def create_queue(self) -> KaraokeQueue or KaraokeFairQueue:
+        if self.config.queue_mode == 'round_robin':
+            return KaraokeFairQueue()
+        if self.config.queue_mode == 'least_sung':
+            return KaraokeFairQueue(self.log.count)
+        return KaraokeQueue()
+
+    @property
+    def songs_limit(self) -> int:
+        return self.config.queue_songs_per_user if isinstance(self.queue, KaraokeFairQueue) else 1
+
+    def record(self, op: str, *args):
+        if self.journal and self.journal.file:
+            self.journal.append(op, *args)
+            if self.journal.needs_snapshot:
+                self.journal.snapshot(self.journal_state())
+
+    def journal_state(self) -> KaraokeJournalState:
+        return KaraokeJournalState([(entry.user.id, entry.comment, entry.round) for entry in self.queue],
+                                   [record.to_tuple() for record in self.log], self.performance)
+
+    async def fetch_user(self, user_id: int) -> User or None:
+        try:
+            return self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+        except discord.HTTPException:
+            return None
+
+    async def fetch_users(self, user_ids: Iterable[int]) -> Dict[int, User]:
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(user_id: int) -> User or None:
+            user = self.bot.get_user(user_id)
+            if user:
+                return user
+            async with semaphore:
+                return await self.fetch_user(user_id)
+
+        user_ids = list(dict.fromkeys(user_ids))
+        users = await asyncio.gather(*map(fetch, user_ids))
+        return {user_id: user for user_id, user in zip(user_ids, users) if user}
+
+    async def restore(self):
+        if not self.journal or self.journal.file:
+            return
+
+        state = self.journal.recover()
+        users = await self.fetch_users(user_id for user_id, _, _ in state.queue)
+        await self.actor.apply(self.apply_restored, state, users)
+
+    def apply_restored(self, state: KaraokeJournalState, users: Dict[int, User]):
+        self.log.restore(state.log)
+        # Entries added while the users were fetched are journaled after the restored ones and go behind them
+        added = [(entry.user, entry.comment, entry.round) for entry in self.queue]
+        self.queue.clear()
+        for user_id, comment, song_round in state.queue:
+            user = users.get(user_id)
+            if user and self.queue.count(user) < self.songs_limit:
+                self.queue.append(user, comment, song_round)
+        # The performance timer is rescheduled from the journaled start, a limit that ran out meanwhile ends it at once
+        entry = self.queue.get(0)
+        if not self.performance and state.performance and entry and entry.user.id == state.performance[0]:
+            self.performance = state.performance
+            self.queue.pin()
+        for user, comment, song_round in added:
+            if self.queue.count(user) < self.songs_limit:
+                self.queue.append(user, comment, song_round)
+
+    def reload(self, config: KaraokeBotConfig):
+        voice_channel_name = self.config.voice_channel_name
+        self.config = self.config.reloaded(config)
+        self.cache.clear()
+        self.queue_pages.clear()
+        self.log_pages.clear()
+        self.role_sync.delay = self.config.role_sync_delay
+        if self.config.voice_channel_name != voice_channel_name:
+            self.rebuild_participants()
+        self.state_changed()
 
     def index_in_queue(self, user: discord.abc.User) -> int:
         return self.queue.index(user) + 1
 
     def add_to_queue(self, user: User, comment: str = None) -> int:
-        self.queue.append(user)
-        if comment:
-            self.user_songs[user.id] = comment
+        index = self.queue.append(user, comment)
+        self.record('add', user.id, comment, self.queue.get(index - 1).round)
+        return index
+
+    def start_performance_timer(self, user: User):
+        self.performance = (user.id, time.time())
+        self.record('perform', *self.performance)
 
-        return self.index_in_queue(user)
+    def add_to_log(self, user, comment: str = None, outcome: str = FINISHED) -> KaraokeHistoryRecord:
+        started_at = None
+        if self.performance and self.performance[0] == user.id:
+            started_at = self.performance[1]
+            self.forget_performance(user)
 
-    def add_to_log(self, user, comment: str = None):
-        self.log.append(KaraokeLog(user, comment))
+        return self.log.append(user.id, comment, started_at, outcome=outcome)
 
     def pop_from_queue(self) -> (User, str or None):
-        user: User = self.queue.pop(0)
-        self.add_to_log(user, self.user_songs.get(user.id))
-        return user, self.user_songs.pop(user.id, None)
+        entry = self.queue.pop()
+        record = self.add_to_log(entry.user, entry.comment)
+        self.record('pop', entry.user.id, record.started_at, record.finished_at)
+        return entry.user, entry.comment
 
     def get_zero_from_queue(self) -> (User or None, str or None):
-        if len(self.queue) >= 1:
-            user: User = self.queue[0]
-            return user, self.user_songs.get(user.id, None)
+        entry = self.queue.get(0)
+        if entry:
+            return entry.user, entry.comment
         else:
             return None, None
 
     def get_first_from_queue(self) -> (User or None, str or None):
-        if len(self.queue) >= 2:
-            user: User = self.queue[1]
-            return user, self.user_songs.get(user.id, None)
+        entry = self.queue.get(1)
+        if entry:
+            return entry.user, entry.comment
         else:
             return None, None
 
+    def forget_performance(self, user: User):
+        # The performing entry has left the queue, its time limit must not end the performance of the next one
+        if self.performance and self.performance[0] == user.id:
+            self.performance = None
+            self.scheduler.cancel('performance')
+
     def remove_from_queue(self, user: User, comment: str = None):
         self.queue.remove(user)
-        self.user_songs.pop(user.id, None)
+        self.forget_performance(user)
+        self.record('remove', user.id)
         # TODO Добавить коммент
 
+    def skip_from_queue(self, user: User, comment: str = None):
+        entry = self.queue.remove(user)
+        record = self.add_to_log(user, entry.comment, outcome=SKIPPED)
+        self.record('skip', user.id, record.started_at, record.finished_at)
+
+    def clear(self):
+        self.log.clear()
+        self.queue.clear()
+        self.performance = None
+        self.ready_check = None
+        self.record('clear')
+
     def get_list_user_description(self, index: int, user: User, comment: str = None) -> str:
-        return self.config.responses['list_item'].format(index=index, user=user.mention,
-                                                         comment=self.config.responses['list_item_comment'].format(
-                                                             comment=comment) if comment else '')
+        return self.config.render('list_item', index=index, user=user.mention, comment=comment)
 
-    def get_log(self) -> str:
-        return self.config.responses['list_delimiter'].join(
-            [self.get_list_user_description(index + 1, log.user, log.comment) for index, log in enumerate(self.log)])
+    def render_board(self) -> str:
+        lines = []
+        current = self.queue.get(0) if self.performance else None
+        if current:
+            lines.append(self.config.render('current_artist', user=current.user.mention, comment=current.comment))
+        else:
+            lines.append(self.config.render('board_idle'))
+
+        start = 1 if current else 0
+        upcoming = [self.queue.get(index) for index in range(start, min(len(self.queue),
+                                                                         start + self.config.board_queue_size))]
+        if upcoming:
+            lines.append(self.config.render('board_queue'))
+            lines += [self.get_list_user_description(index, entry.user, entry.comment)
+                      for index, entry in enumerate(upcoming, start + 1)]
+
+        recent = self.log.recent(self.config.board_history_size)
+        if recent:
+            lines.append(self.config.render('board_history'))
+            lines += [self.get_list_user_description(len(self.log) - offset, record, record.comment)
+                      for offset, record in enumerate(recent)]
+
+        return '\n'.join(lines)
+
+    def state_changed(self):
+        self.reschedule()
+        self.board_changed()
+
+    def reschedule(self):
+        # Timers follow the state, whatever the transition was they match the current performance and queue head
+        if self.performance and self.config.performance_limit:
+            started_at = self.performance[1]
+            self.scheduler.schedule('performance', started_at + self.config.performance_limit,
+                                    self.expire_performance, started_at)
+        else:
+            self.scheduler.cancel('performance')
 
-    def get_queue_list(self) -> str:
-        return self.config.responses['list_delimiter'].join(
-            [self.get_list_user_description(index + 1, user, self.user_songs.get(
-                user.id)) for index, user in enumerate(self.queue)])
+        entry = self.queue.get(0)
+        if self.ready_check and not self.performance and entry and entry.user.id == self.ready_check[0]:
+            self.scheduler.schedule('ready', self.ready_check[1], self.expire_ready, self.ready_check[0])
+        else:
+            self.ready_check = None
+            self.scheduler.cancel('ready')
+
+    def schedule_leave(self, user: User):
+        if self.config.leave_grace and user in self.queue:
+            self.scheduler.schedule(('leave', user.id), time.time() + self.config.leave_grace,
+                                    self.expire_participant, user)
+
+    def track_leave(self, member: Member, before: VoiceState, after: VoiceState):
+        if member in self.participants:
+            self.scheduler.cancel(('leave', member.id))
+        elif before.channel and self.is_event_guild(before.channel.guild) and self.is_event_voice_channel(
+                before.channel):
+            self.schedule_leave(member)
+
+    def board_changed(self):
+        if self.config.board_enabled:
+            self.board.touch()
+
+    def announce(self, content: str) -> List[KaraokeNotification]:
+        # In board mode transitions are shown on the board instead of separate posts
+        return [] if self.config.board_enabled else [KaraokeNotification(self.text_channel, content)]
+
+    def get_page(self, pages: List[str], page: int = 1) -> str:
+        if not pages:
+            return ''
+
+        page = min(max(page, 1), len(pages))
+        if len(pages) > 1:
+            return pages[page - 1] + self.config.render('list_page', page=page, pages=len(pages))
+        return pages[page - 1]
+
+    def get_log(self, page: int = 1) -> str:
+        pages = self.log_pages.get(self.log.version,
+                                   ((record, record, record.comment) for record in self.log),
+                                   self.config.responses['list_delimiter'], self.config.responses['list_page'],
+                                   start=self.log.spilled)
+        return self.get_page(pages, page)
+
+    def get_queue_list(self, page: int = 1) -> str:
+        pages = self.queue_pages.get(self.queue.version,
+                                     (((entry.user.id, entry.slot), entry.user, entry.comment) for entry in self.queue),
+                                     self.config.responses['list_delimiter'], self.config.responses['list_page'])
+        return self.get_page(pages, page)
+
+    def __resolve(self, id_attribute: str, name: str, get: Callable[[int], Any], collection: List[Any]) -> Any:
+        entity_id = getattr(self.config, id_attribute)
+        entity = self.cache.get(entity_id)
+
+        if not entity:
+            entity = find(get, collection, entity_id, name)
+            if entity:
+                setattr(self.config, id_attribute, entity.id)
+                self.cache.put(entity)
+
+        return entity
 
     @property
     def guild(self) -> Guild:
+        # Not cached, discord.py replaces the guild object once the guild is available again after an outage
         return self.bot.get_guild(self.config.guild_id)
 
     @property
     def admin_role(self) -> Role:
-        return discord.utils.get(self.guild.roles, name=self.config.admin_role_name)
+        guild = self.guild
+        return self.__resolve('admin_role_id', self.config.admin_role_name, guild.get_role, guild.roles)
 
     def is_admin_user(self, user: Member) -> bool:
-        return self.admin_role in user.roles
+        role = self.admin_role
+        return bool(role) and role.id in self.cache.roles(user)
 
     @property
     def member_role(self) -> Role:
-        return discord.utils.get(self.guild.roles, name=self.config.member_role_name)
+        guild = self.guild
+        return self.__resolve('member_role_id', self.config.member_role_name, guild.get_role, guild.roles)
 
     def is_member_user(self, user: Member) -> bool:
-        return self.member_role in user.roles
+        role = self.member_role
+        return bool(role) and role.id in self.cache.roles(user)
 
     @property
     def voice_channel(self):
-        return discord.utils.get(self.guild.channels, name=self.config.voice_channel_name)
+        guild = self.guild
+        return self.__resolve('voice_channel_id', self.config.voice_channel_name, guild.get_channel, guild.channels)
 
     @property
     def text_channel(self):
-        return discord.utils.get(self.guild.channels, name=self.config.text_channel_name)
+        guild = self.guild
+        return self.__resolve('text_channel_id', self.config.text_channel_name, guild.get_channel, guild.channels)
 
-    async def change_users_mic_state(self, user_ids: List[int], state: bool):
-        for member in self.voice_channel.members:
-            if member.id in user_ids:
-                if state:
-                    await member.edit(mute=False)
-                else:
-                    await member.edit(mute=True)
+    def get_participants(self, user_ids: Iterable[int]) -> List[Member]:
+        return [member for member in map(self.participants.get, user_ids) if member]
 
-    async def __define_roles(self):
-        guild = self.guild
+    async def change_users_mic_state(self, unmute: Iterable[int], mute: Iterable[int]):
+        await self.mic.switch(self.voice_channel, self.get_participants(unmute),
+                              [self.participants.get(user_id) or discord.Object(user_id) for user_id in mute])
+
+    async def mute_room(self, ctx: Context):
+        keep = {member.id for member in self.participants.members.values() if self.is_admin_user(member)}
+        if self.performance:
+            keep.add(self.performance[0])
+        await asyncio.gather(ctx.message.delete(),
+                             self.mic.mute_room(self.voice_channel, list(self.participants.members.values()), keep))
+        await ctx.channel.send(self.config.render('room_has_been_muted'))
 
-        if not self.admin_role:
-            self.config.admin_role_id = (await guild.create_role(name=self.config.admin_role_name)).id
+    async def unmute_room(self, ctx: Context):
+        await asyncio.gather(ctx.message.delete(), self.mic.restore(self.voice_channel))
+        await ctx.channel.send(self.config.render('room_has_been_unmuted'))
 
-        if not self.member_role:
-            self.config.member_role_id = (await guild.create_role(name=self.config.member_role_name)).id
+    async def __define_roles(self):
+        await KaraokeProvisioner(self.config).define_roles(self.guild)
 
     def is_event_guild(self, guild: Guild) -> bool:
         return guild.id == self.config.guild_id
@@ -122,233 +365,324 @@ class KaraokeBot:
     def is_event_text_channel(self, channel: GuildChannel or PrivateChannel) -> bool:
         return channel.id == self.config.text_channel_id
 
-    async def apply_roles(self, member: Member, before: VoiceState, after: VoiceState):
+    def apply_roles(self, member: Member, before: VoiceState, after: VoiceState):
+        if after.channel and self.is_event_guild(after.channel.guild) and self.is_event_voice_channel(after.channel):
+            self.role_sync.schedule(member, True)
+        elif before.channel and self.is_event_guild(before.channel.guild) and self.is_event_voice_channel(
+                before.channel):
+            self.role_sync.schedule(member, False)
+
+    async def reconcile_roles(self):
+        voice_channel, member_role = self.voice_channel, self.member_role
+        if not voice_channel or not member_role:
+            return
+
+        # Guilds are not chunked, the cached role members are completed with the saved holders fetched one by one
+        guild = voice_channel.guild
+        members = {member.id: member for member in member_role.members}
+        voice_ids = {member.id for member in voice_channel.members}
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+        gone = []
+
+        async def fetch(member_id: int) -> Member or None:
+            member = guild.get_member(member_id)
+            if member:
+                return member
+            async with semaphore:
+                try:
+                    return await guild.fetch_member(member_id)
+                except discord.NotFound:
+                    gone.append(member_id)
+                except discord.HTTPException as error:
+                    # Checked again on the next start
+                    logger.warning('Failed to fetch role member %s: %s', member_id, error)
+                return None
+
+        missing = [member_id for member_id in self.role_sync.holders(member_role)
+                   if member_id not in members and member_id not in voice_ids]
+        fetched = await asyncio.gather(*map(fetch, missing))
+        self.role_sync.forget(gone)
+        members.update((member.id, member) for member in fetched if member)
+        self.role_sync.reconcile(voice_channel.members, members.values())
+
+    def update_participants(self, member: Member, before: VoiceState, after: VoiceState):
         if after.channel and self.is_event_guild(after.channel.guild) and self.is_event_voice_channel(after.channel):
-            await member.add_roles(self.member_role)
+            self.participants.join(member)
         elif before.channel and self.is_event_guild(before.channel.guild) and self.is_event_voice_channel(
                 before.channel):
-            await member.remove_roles(self.member_role)
+            self.participants.leave(member.id)
+
+    def rebuild_participants(self):
+        voice_channel = self.voice_channel
+        self.participants.rebuild(voice_channel.members if voice_channel else [])
 
     def is_user_in_event(self, user: User) -> bool:
-        return bool(discord.utils.get(self.voice_channel.members, id=user.id))
-
-    def __define_handlers(self):
-        @self.bot.event
-        async def on_ready():
-            await self.__define_roles()
-
-        @self.bot.event
-        async def on_voice_state_update(member: Member, before: VoiceState, after: VoiceState):
-            await self.apply_roles(member, before, after)
-
-        @self.bot.command(name=self.config.commands['add_me_to_queue'])
-        @direct_message()
-        async def add_me_to_queue(ctx: Context, comment: str = None):
-            send = ctx.channel.send
-            author = ctx.message.author
-
-            if not self.is_user_in_event(author):
-                await send(self.config.responses['you_are_not_in_event'].format(channel=self.voice_channel.mention))
-            elif author in self.queue:
-                await send(self.config.responses['you_are_already_in_queue'].format(index=self.index_in_queue(author)))
-            else:
-                await send(
-                    self.config.responses['you_are_added_in_queue_with_number'].format(
-                        index=self.add_to_queue(author, comment)))
-
-        @self.bot.command(name=self.config.commands['show_log_of_artists'])
-        @commands.has_role(self.config.admin_role_name)
-        @allowed_guilds([self.config.guild_id])
-        async def show_log_of_artists(ctx: Context):
-            await ctx.message.delete()
-            await ctx.channel.send(self.get_log() or self.config.responses['log_empty'])
-
-        @self.bot.command(name=self.config.commands['show_queue_of_artists'])
-        async def show_queue_of_artists(ctx: Context):
-            author = ctx.message.author
-
-            if type(ctx.channel) is DMChannel:
-                await ctx.channel.send(self.get_queue_list() or self.config.responses['queue_is_empty_for_user'])
-            elif self.is_event_text_channel(ctx.channel) and self.is_admin_user(author):
-                await ctx.message.delete()
-                await ctx.channel.send(self.get_queue_list() or self.config.responses['queue_is_empty_for_guild'])
-
-        @self.bot.command(name=self.config.commands['start_performance'])
-        @commands.has_role(self.config.admin_role_name)
-        @allowed_guilds([self.config.guild_id])
-        @allowed_channels(channel_names=[self.config.text_channel_name, self.config.voice_channel_name])
-        async def start_performance(ctx: Context):
-            await ctx.message.delete()
-
-            user, comment = self.get_zero_from_queue()
-            if user:
-                await self.change_users_mic_state([user.id], state=True)
-                await self.start_artist_performance(user, comment)
-
-                next_user, next_comment = self.get_first_from_queue()
-                if next_user:
-                    await self.next_artist_performance(next_user, next_comment)
-            else:
-                await self.queue_is_empty_for_guild()
-
-        @self.bot.command(name=self.config.commands['finish_performance'])
-        @commands.has_role(self.config.admin_role_name)
-        @allowed_guilds([self.config.guild_id])
-        @allowed_channels(channel_names=[self.config.text_channel_name, self.config.voice_channel_name])
-        async def finish_performance(ctx: Context):
-            await ctx.message.delete()
-
-            if self.queue:
-                user, comment = self.pop_from_queue()
-                await self.change_users_mic_state([user.id], state=False)
-                await self.finish_artist_performance(user, comment)
-
-                next_user, next_comment = self.get_zero_from_queue()
-                if next_user:
-                    await self.be_ready_artist_performance(next_user, next_comment)
-            else:
-                await self.queue_is_empty_for_guild()
-
-        @self.bot.command(name=self.config.commands['skip_performance'])
-        @commands.has_role(self.config.admin_role_name)
-        @allowed_guilds([self.config.guild_id])
-        @allowed_channels(channel_names=[self.config.text_channel_name, self.config.voice_channel_name])
-        async def skip_performance(ctx: Context, member: discord.Member, comment: str = None):
-            await ctx.message.delete()
-            user: User = member._user
-
-            if user in self.queue:
-                self.change_users_mic_state([user.id], False)
-                self.remove_from_queue(user, comment)
-                await self.skip_artist_performance(user, comment)
-            else:
-                await self.user_not_in_queue()
-
-        @self.bot.command(name=self.config.commands['remove_me_from_queue'])
-        @direct_message()
-        async def remove_me_from_queue(ctx: Context, comment: str = None):
-            author = ctx.message.author
-
-            if author in self.queue:
-                self.remove_from_queue(author, comment)
-                await ctx.channel.send(self.config.responses['your_performance_is_skipped'].format(user=author.mention,
-                                                                                                   comment=
-                                                                                                   self.config.responses[
-                                                                                                       'skip_artist_performance_comment'].format(
-                                                                                                       comment=comment) if comment else ''))
-            else:
-                await ctx.channel.send(self.config.responses['you_are_not_in_queue'])
-
-        @self.bot.command(name=self.config.commands['stop'])
-        @commands.has_role(self.config.admin_role_name)
-        @allowed_guilds([self.config.guild_id])
-        async def stop_karaoke(ctx: Context):
-            guild = ctx.guild
-
-            text_channel = discord.utils.get(guild.text_channels, name=self.config.text_channel_name)
-            if text_channel:
-                await text_channel.delete()
-
-            voice_channel = discord.utils.get(guild.voice_channels, name=self.config.voice_channel_name)
-            if voice_channel:
-                await voice_channel.delete()
-
-            await ctx.channel.send(self.config.responses['event_has_been_stopped'])
-
-            self.log.clear()
-            self.queue.clear()
-            self.user_songs.clear()
-
-        @self.bot.command(name=self.config.commands['start'])
-        @commands.has_role(self.config.admin_role_name)
-        @allowed_guilds([self.config.guild_id])
-        async def start_karaoke(ctx: Context):
-            guild = ctx.guild
-            category = discord.utils.get(guild.categories, name=self.config.category_name)
-
-            if not category:
-                category = await guild.create_category(self.config.category_name)
-
-            text_channel = discord.utils.get(guild.text_channels, name=self.config.text_channel_name)
-            if not text_channel:
-                text_channel = await guild.create_text_channel(self.config.text_channel_name, category=category,
-                                                               overwrites={
-                                                                   guild.default_role: discord.PermissionOverwrite(
-                                                                       read_messages=False, connect=False),
-                                                                   self.member_role: discord.PermissionOverwrite(
-                                                                       read_messages=True, send_messages=True,
-                                                                       connect=True, speak=False),
-                                                                   self.admin_role: discord.PermissionOverwrite(
-                                                                       read_messages=True, send_messages=True,
-                                                                       connect=True, speak=True)
-                                                               })
-            self.config.text_channel_id = text_channel.id
-
-            voice_channel = discord.utils.get(guild.text_channels, name=self.config.voice_channel_name)
-            if not voice_channel:
-                voice_channel = await guild.create_voice_channel(self.config.voice_channel_name, category=category,
-                                                                 overwrites={
-                                                                     guild.default_role: discord.PermissionOverwrite(
-                                                                         connect=True, speak=False),
-                                                                     self.member_role: discord.PermissionOverwrite(
-                                                                         connect=True, speak=False),
-                                                                     self.admin_role: discord.PermissionOverwrite(
-                                                                         connect=True, speak=True)
-                                                                 })
-            self.config.voice_channel_id = voice_channel.id
-
-            await ctx.channel.send(self.config.responses['event_has_been_started'])
-
-    async def start_artist_performance(self, user: Member, comment: str = None):
-        await user.send(self.config.responses['your_performance_starts_now'])
-        await self.text_channel.send(self.config.responses['start_artist_performance'].format(user=user.mention,
-                                                                                              comment=
-                                                                                              self.config.responses[
-                                                                                                  'artist_comment'].format(
-                                                                                                  comment=comment) if comment else ''))
-
-    async def skip_artist_performance(self, user: Member, comment: str = None):
-        await user.send(self.config.responses['your_performance_is_skipped'].format(comment=self.config.responses[
-            'skip_artist_performance_comment'].format(
-            comment=comment) if comment else ''))
-        await self.text_channel.send(self.config.responses['skip_artist_performance'].format(user=user.mention,
-                                                                                             comment=
-                                                                                             self.config.responses[
-                                                                                                 'skip_artist_performance_comment'].format(
-                                                                                                 comment=comment) if comment else ''))
-
-    async def next_artist_performance(self, user: Member, comment: str = None):
-        await user.send(self.config.responses['next_performance_is_yours'])
-        await self.text_channel.send(self.config.responses['next_artist_performance'].format(user=user.mention,
-                                                                                             comment=
-                                                                                             self.config.responses[
-                                                                                                 'artist_comment'].format(
-                                                                                                 comment=comment) if comment else ''))
-
-    async def finish_artist_performance(self, user: Member, comment: str = None):
-        await user.send(self.config.responses['your_performance_is_finished'])
-        await self.text_channel.send(self.config.responses['finish_artist_performance'].format(user=user.mention,
-                                                                                               comment=
-                                                                                               self.config.responses[
-                                                                                                   'artist_comment'].format(
-                                                                                                   comment=comment) if comment else ''))
-
-    async def be_ready_artist_performance(self, user: Member, comment: str = None):
-        await user.send(self.config.responses['you_have_to_be_ready_to_perform'])
-        await self.text_channel.send(self.config.responses['be_ready_artist_performance'].format(user=user.mention,
-                                                                                                 comment=
-                                                                                                 self.config.responses[
-                                                                                                     'artist_comment'].format(
-                                                                                                     comment=comment) if comment else ''))
-
-    async def user_not_in_queue(self):
-        await self.text_channel.send(self.config.responses['user_not_in_queue'])
-
-    async def queue_is_empty_for_guild(self):
-        await self.text_channel.send(self.config.responses['queue_is_empty_for_guild'])
-
-    def run(self, token: str):
-        self.bot = Bot(command_prefix=self.config.command_prefix)
-        self.__define_handlers()
-
-        self.bot.run(token)
+        return user in self.participants
+
+    def is_event_channel(self, channel: GuildChannel or PrivateChannel) -> bool:
+        return channel.id in (self.config.text_channel_id, self.config.voice_channel_id) or getattr(
+            channel, 'name', None) in (self.config.text_channel_name, self.config.voice_channel_name)
+
+    async def on_ready(self):
+        self.cache.clear()
+        self.cache.track_members = self.bot.intents.members
+        self.rebuild_participants()
+        await self.__define_roles()
+        self.role_sync.start()
+        await self.reconcile_roles()
+        await self.restore()
+        for entry in list(self.queue):
+            if entry.user not in self.participants:
+                self.schedule_leave(entry.user)
+        self.state_changed()
+
+    async def on_resumed(self):
+        self.rebuild_participants()
+
+    async def on_guild_available(self, guild: Guild):
+        # Roles, channels and members resolved from the previous guild object are no longer updated
+        self.cache.clear()
+        self.rebuild_participants()
+
+    async def on_guild_unavailable(self, guild: Guild):
+        self.cache.clear()
+
+    async def on_guild_role_update(self, before: Role, after: Role):
+        self.cache.invalidate(after.id)
+
+    async def on_guild_role_delete(self, role: Role):
+        self.cache.invalidate(role.id)
+
+    async def on_guild_channel_update(self, before: GuildChannel, after: GuildChannel):
+        self.cache.invalidate(after.id)
+
+    async def on_guild_channel_delete(self, channel: GuildChannel):
+        self.cache.invalidate(channel.id)
+
+    async def on_member_update(self, before: Member, after: Member):
+        self.cache.invalidate_member(after.id)
+
+    async def on_voice_state_update(self, member: Member, before: VoiceState, after: VoiceState):
+        self.update_participants(member, before, after)
+        self.track_leave(member, before, after)
+        self.apply_roles(member, before, after)
+
+    def enqueue(self, user: User, comment: str = None) -> str:
+        if not self.is_user_in_event(user):
+            return self.config.render('you_are_not_in_event', channel=self.voice_channel.mention)
+        elif self.queue.count(user) >= self.songs_limit:
+            if self.songs_limit == 1:
+                return self.config.render('you_are_already_in_queue', index=self.index_in_queue(user))
+            return self.config.render('you_have_reached_songs_limit', limit=self.songs_limit,
+                                      index=self.index_in_queue(user))
+        else:
+            return self.config.render('you_are_added_in_queue_with_number', index=self.add_to_queue(user, comment))
+
+    def dequeue(self, user: User, comment: str = None) -> str:
+        if user in self.queue:
+            self.remove_from_queue(user, comment)
+            return self.config.render('your_performance_is_skipped', user=user.mention, comment=comment)
+        else:
+            return self.config.render('you_are_not_in_queue')
+
+    def begin_performance(self) -> KaraokeEffects:
+        user, comment = self.get_zero_from_queue()
+        if not user:
+            return KaraokeEffects(tuple(self.queue_is_empty_for_guild()))
+
+        self.start_performance_timer(user)
+        self.queue.pin()
+        notifications = self.start_artist_performance(user, comment)
+
+        next_user, next_comment = self.get_first_from_queue()
+        if next_user:
+            notifications += self.next_artist_performance(next_user, next_comment)
+
+        return KaraokeEffects(tuple(notifications), unmute=(user.id,))
+
+    def end_performance(self) -> KaraokeEffects:
+        if not self.queue:
+            return KaraokeEffects(tuple(self.queue_is_empty_for_guild()))
+
+        user, comment = self.pop_from_queue()
+        notifications = self.finish_artist_performance(user, comment) + self.call_next_artist()
+
+        return KaraokeEffects(tuple(notifications), mute=(user.id,))
+
+    def call_next_artist(self) -> List[KaraokeNotification]:
+        user, comment = self.get_zero_from_queue()
+        if not user:
+            return []
+
+        if self.config.ready_timeout:
+            self.ready_check = (user.id, time.time() + self.config.ready_timeout)
+        return self.be_ready_artist_performance(user, comment)
+
+    def confirm(self, user: User) -> str:
+        if not self.ready_check or self.ready_check[0] != user.id:
+            return self.config.render('ready_is_not_expected')
+
+        self.ready_check = None
+        return self.config.render('you_are_ready')
+
+    def timeout_performance(self, started_at: float) -> KaraokeEffects:
+        # An admin could have finished the performance right before the timer fired
+        entry = self.queue.get(0)
+        if not self.performance or self.performance[1] != started_at or not entry or \
+                entry.user.id != self.performance[0]:
+            return KaraokeEffects()
+        return self.end_performance()
+
+    def timeout_ready(self, user_id: int) -> KaraokeEffects:
+        entry = self.queue.get(0)
+        if self.performance or not self.ready_check or self.ready_check[0] != user_id or not entry or \
+                entry.user.id != user_id:
+            return KaraokeEffects()
+
+        self.ready_check = None
+        self.skip_from_queue(entry.user)
+        return KaraokeEffects(tuple(self.skip_artist_performance(entry.user) + self.call_next_artist()))
+
+    def expel(self, user: User) -> KaraokeEffects:
+        # Back in the voice channel before the grace period ran out
+        if user in self.participants or user not in self.queue:
+            return KaraokeEffects()
+
+        notifications = [KaraokeNotification(user, self.config.render('you_are_removed_from_queue'))]
+        called = bool(self.ready_check and self.ready_check[0] == user.id)
+        mute = ()
+        if self.performance and self.performance[0] == user.id:
+            called, mute = True, (user.id,)
+            self.skip_from_queue(user)
+            notifications += self.announce(self.config.render('skip_artist_performance', user=user.mention,
+                                                              comment=None))
+        while user in self.queue:
+            self.remove_from_queue(user)
+
+        if called:
+            self.ready_check = None
+            notifications += self.call_next_artist()
+        # The speak grant of the performer is revoked as at the end of a performance
+        return KaraokeEffects(tuple(notifications), mute=mute)
+
+    def drop_performance(self, user: User, comment: str = None) -> KaraokeEffects:
+        if user not in self.queue:
+            return KaraokeEffects(tuple(self.user_not_in_queue()))
+
+        self.skip_from_queue(user, comment)
+        return KaraokeEffects(tuple(self.skip_artist_performance(user, comment)), mute=(user.id,))
+
+    async def perform(self, effects: KaraokeEffects):
+        await asyncio.gather(self.change_users_mic_state(effects.unmute, effects.mute),
+                             self.notify(list(effects.notifications)))
+
+    async def expire_performance(self, started_at: float):
+        await self.perform(await self.actor.apply(self.timeout_performance, started_at))
+
+    async def expire_ready(self, user_id: int):
+        await self.perform(await self.actor.apply(self.timeout_ready, user_id))
+
+    async def expire_participant(self, user: User):
+        await self.perform(await self.actor.apply(self.expel, user))
+
+    async def confirm_ready(self, ctx: Context):
+        await ctx.channel.send(await self.actor.apply(self.confirm, ctx.message.author))
+
+    async def add_me_to_queue(self, ctx: Context, comment: str = None):
+        await ctx.channel.send(await self.actor.apply(self.enqueue, ctx.message.author, comment))
+
+    async def show_log_of_artists(self, ctx: Context, page: int = 1):
+        log = await self.actor.read(self.get_log, page)
+        await asyncio.gather(ctx.message.delete(), ctx.channel.send(log or self.config.render('log_empty')))
+
+    async def show_queue_of_artists(self, ctx: Context, page: int = 1):
+        author = ctx.message.author
+
+        if isinstance(ctx.channel, DMChannel):
+            queue = await self.actor.read(self.get_queue_list, page)
+            await ctx.channel.send(queue or self.config.render('queue_is_empty_for_user'))
+        elif self.is_event_text_channel(ctx.channel) and self.is_admin_user(author):
+            queue = await self.actor.read(self.get_queue_list, page)
+            await asyncio.gather(ctx.message.delete(),
+                                 ctx.channel.send(queue or self.config.render('queue_is_empty_for_guild')))
+
+    async def start_performance(self, ctx: Context):
+        effects = await self.actor.apply(self.begin_performance)
+        await asyncio.gather(ctx.message.delete(), self.perform(effects))
+
+    async def finish_performance(self, ctx: Context):
+        effects = await self.actor.apply(self.end_performance)
+        await asyncio.gather(ctx.message.delete(), self.perform(effects))
+
+    async def skip_performance(self, ctx: Context, member: discord.Member, comment: str = None):
+        effects = await self.actor.apply(self.drop_performance, member._user, comment)
+        await asyncio.gather(ctx.message.delete(), self.perform(effects))
+
+    async def remove_me_from_queue(self, ctx: Context, comment: str = None):
+        await ctx.channel.send(await self.actor.apply(self.dequeue, ctx.message.author, comment))
+
+    async def stop_karaoke(self, ctx: Context):
+        await KaraokeProvisioner(self.config).teardown(ctx.guild)
+        self.board.reset()
+        self.mic.reset()
+        await ctx.channel.send(self.config.render('event_has_been_stopped'))
+
+        await self.actor.apply(self.clear)
+        self.scheduler.clear()
+        self.participants.clear()
+
+    async def start_karaoke(self, ctx: Context):
+        await KaraokeProvisioner(self.config).provision(ctx.guild)
+        self.cache.clear()
+        self.rebuild_participants()
+        self.board_changed()
+
+        await ctx.channel.send(self.config.render('event_has_been_started'))
+
+    def start_artist_performance(self, user: Member, comment: str = None) -> List[KaraokeNotification]:
+        return [KaraokeNotification(user, self.config.render('your_performance_starts_now'))] + self.announce(
+            self.config.render('start_artist_performance', user=user.mention, comment=comment))
+
+    def skip_artist_performance(self, user: Member, comment: str = None) -> List[KaraokeNotification]:
+        return [KaraokeNotification(user, self.config.render('your_performance_is_skipped', user=user.mention,
+                                                         comment=comment))] + self.announce(
+            self.config.render('skip_artist_performance', user=user.mention, comment=comment))
+
+    def next_artist_performance(self, user: Member, comment: str = None) -> List[KaraokeNotification]:
+        return [KaraokeNotification(user, self.config.render('next_performance_is_yours'))] + self.announce(
+            self.config.render('next_artist_performance', user=user.mention, comment=comment))
+
+    def finish_artist_performance(self, user: Member, comment: str = None) -> List[KaraokeNotification]:
+        return [KaraokeNotification(user, self.config.render('your_performance_is_finished'))] + self.announce(
+            self.config.render('finish_artist_performance', user=user.mention, comment=comment))
+
+    def be_ready_artist_performance(self, user: Member, comment: str = None) -> List[KaraokeNotification]:
+        return [KaraokeNotification(user, self.config.render('you_have_to_be_ready_to_perform'))] + self.announce(
+            self.config.render('be_ready_artist_performance', user=user.mention, comment=comment))
+
+    async def notify(self, notifications: List[KaraokeNotification]) -> List[KaraokeNotificationFailure]:
+        return await self.notifier.dispatch(notifications)
+
+    def user_not_in_queue(self) -> List[KaraokeNotification]:
+        return [KaraokeNotification(self.text_channel, self.config.render('user_not_in_queue'))]
+
+    def queue_is_empty_for_guild(self) -> List[KaraokeNotification]:
+        return [KaraokeNotification(self.text_channel, self.config.render('queue_is_empty_for_guild'))]
+
+    def use_metrics(self, metrics: KaraokeMetrics):
+        self.metrics = self.notifier.metrics = self.actor.metrics = self.role_sync.metrics = self.mic.metrics = \
+            self.board.metrics = self.scheduler.metrics = metrics
+
+    def close(self):
+        self.board.stop()
+        self.scheduler.stop()
+        self.actor.stop()
+        self.role_sync.stop()
+        if self.journal:
+            self.journal.close()
+        self.log.close()
+
+    def run(self, token: str, measure_startup: bool = False):
+        from .karaoke_cluster import KaraokeCluster
+
+        KaraokeCluster([self], sharded=self.config.sharded).run(token, measure_startup)
@@ -1,6 +1,28 @@
+import dataclasses
 import json
-from dataclasses import dataclass
-from typing import Dict
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from .karaoke_responses import KaraokeTemplate, KaraokeConfigError, compile_responses, RESPONSE_DEFAULTS
+
+QUEUE_MODES = ('fifo', 'round_robin', 'least_sung')
+MIC_MODES = ('mute', 'overwrites')
+GATEWAY_PROFILES = ('default', 'minimal', 'members')
+
+# Commands added after the first release, configs written before them keep loading
+COMMAND_DEFAULTS = {
+    'show_stats': 'stats',
+    'reload_config': 'reload',
+    'mute_room': 'mute',
+    'unmute_room': 'unmute',
+    'confirm_ready': 'ready',
+}
+
+# Settings applied by a reload, the rest is bound to the running bot until restart
+RELOADABLE_FIELDS = ('category_name', 'text_channel_name', 'voice_channel_name', 'admin_role_name',
+                     'member_role_name', 'command_prefix', 'responses', 'role_sync_delay', 'queue_songs_per_user',
+                     'board_queue_size', 'board_history_size', 'performance_limit', 'ready_timeout', 'leave_grace')
 
 
 @dataclass
@@ -18,6 +40,60 @@ class KaraokeBotConfig:
     voice_channel_id: int = None
     admin_role_id: int = None
     member_role_id: int = None
+    role_sync_delay: float = 1.0
+    role_sync_concurrency: int = 4
+    storage_path: str = None
+    storage_fsync_interval: float = 1.0
+    storage_snapshot_every: int = 1000
+    history_capacity: int = 1000
+    queue_mode: str = 'fifo'
+    queue_songs_per_user: int = 3
+    mic_mode: str = 'mute'
+    mic_concurrency: int = 4
+    board_enabled: bool = False
+    board_interval: float = 2.0
+    board_queue_size: int = 5
+    board_history_size: int = 5
+    # Seconds, 0 disables the timer
+    performance_limit: float = 0
+    ready_timeout: float = 0
+    leave_grace: float = 0
+    sharded: bool = False
+    gateway_profile: str = 'default'
+    # Messages cached by discord.py, the default of the profile when not set, 0 disables the cache
+    gateway_max_messages: int = None
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = None
+    metrics_profile_interval: float = 0
+    path: str = None
+    templates: Dict[str, KaraokeTemplate] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.queue_mode not in QUEUE_MODES:
+            raise KaraokeConfigError(f'queue.mode: unknown mode {self.queue_mode}, expected one of '
+                                     f'{", ".join(QUEUE_MODES)}')
+        if self.mic_mode not in MIC_MODES:
+            raise KaraokeConfigError(f'mic.mode: unknown mode {self.mic_mode}, expected one of {", ".join(MIC_MODES)}')
+        if self.gateway_profile not in GATEWAY_PROFILES:
+            raise KaraokeConfigError(f'gateway.profile: unknown profile {self.gateway_profile}, expected one of '
+                                     f'{", ".join(GATEWAY_PROFILES)}')
+        self.templates = compile_responses(self.responses)
+        self.commands = {**COMMAND_DEFAULTS, **self.commands}
+        self.responses = {**RESPONSE_DEFAULTS, **self.responses}
+
+    def render(self, key: str, **values) -> str:
+        return self.templates[key](**values)
+
+    def reloaded(self, config: 'KaraokeBotConfig') -> 'KaraokeBotConfig':
+        reloaded = dataclasses.replace(self, **{name: getattr(config, name) for name in RELOADABLE_FIELDS})
+        # Resolved ids are kept unless the entity was renamed
+        for id_attribute, name_attribute in (('text_channel_id', 'text_channel_name'),
+                                             ('voice_channel_id', 'voice_channel_name'),
+                                             ('admin_role_id', 'admin_role_name'),
+                                             ('member_role_id', 'member_role_name')):
+            if getattr(reloaded, name_attribute) != getattr(self, name_attribute):
+                setattr(reloaded, id_attribute, None)
+        return reloaded
 
     @classmethod
     def from_dict(cls, subject: dict):
@@ -31,10 +107,73 @@ class KaraokeBotConfig:
             command_prefix=subject['command_prefix'],
             commands=subject['commands'],
             responses=subject['responses'],
+            role_sync_delay=subject['roles'].get('sync', {}).get('delay', 1.0),
+            role_sync_concurrency=subject['roles'].get('sync', {}).get('concurrency', 4),
+            storage_path=subject.get('storage', {}).get('path'),
+            storage_fsync_interval=subject.get('storage', {}).get('fsync_interval', 1.0),
+            storage_snapshot_every=subject.get('storage', {}).get('snapshot_every', 1000),
+            history_capacity=subject.get('history', {}).get('capacity', 1000),
+            queue_mode=subject.get('queue', {}).get('mode', 'fifo'),
+            queue_songs_per_user=subject.get('queue', {}).get('songs_per_user', 3),
+            mic_mode=subject.get('mic', {}).get('mode', 'mute'),
+            mic_concurrency=subject.get('mic', {}).get('concurrency', 4),
+            board_enabled=subject.get('board', {}).get('enabled', False),
+            board_interval=subject.get('board', {}).get('interval', 2.0),
+            board_queue_size=subject.get('board', {}).get('queue_size', 5),
+            board_history_size=subject.get('board', {}).get('history_size', 5),
+            performance_limit=subject.get('timers', {}).get('performance_limit', 0),
+            ready_timeout=subject.get('timers', {}).get('ready_timeout', 0),
+            leave_grace=subject.get('timers', {}).get('leave_grace', 0),
+            sharded=subject.get('sharded', False),
+            gateway_profile=subject.get('gateway', {}).get('profile', 'default'),
+            gateway_max_messages=subject.get('gateway', {}).get('max_messages'),
+            metrics_host=subject.get('metrics', {}).get('host', '127.0.0.1'),
+            metrics_port=subject.get('metrics', {}).get('port'),
+            metrics_profile_interval=subject.get('metrics', {}).get('profile_interval', 0),
         )
 
     @classmethod
     def from_config_file(cls, path: str):
         with open(path) as f:
             data = f.read()
-        return cls.from_dict(json.loads(data))
+        config = cls.from_dict(json.loads(data))
+        config.path = path
+        return config
+
+    @classmethod
+    def from_file(cls, path: str) -> List['KaraokeBotConfig']:
+        with open(path) as f:
+            configs = cls.from_multi_guild_dict(json.loads(f.read()))
+        for config in configs:
+            config.path = path
+        return configs
+
+    @classmethod
+    def from_multi_guild_dict(cls, subject: dict) -> List['KaraokeBotConfig']:
+        if 'guilds' not in subject:
+            return [cls.from_dict(subject)]
+
+        shared = {key: value for key, value in subject.items() if key != 'guilds'}
+        return [cls.from_dict({**shared, **guild}) for guild in subject['guilds']]
+
+    @classmethod
+    def from_path(cls, path: str) -> List['KaraokeBotConfig']:
+        if os.path.isdir(path):
+            configs = []
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.json'):
+                    configs += cls.from_file(os.path.join(path, name))
+        else:
+            configs = cls.from_file(path)
+
+        # Events sharing a storage directory get a subdirectory each
+        storage_paths = [config.storage_path for config in configs]
+        events: Dict[int, int] = dict()
+        for config in configs:
+            if config.storage_path and storage_paths.count(config.storage_path) > 1:
+                events[config.guild_id] = events.get(config.guild_id, 0) + 1
+                suffix = str(config.guild_id) if events[config.guild_id] == 1 else \
+                    f'{config.guild_id}-{events[config.guild_id]}'
+                config.storage_path = os.path.join(config.storage_path, suffix)
+
+        return configs
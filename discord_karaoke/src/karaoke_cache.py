@@ -0,0 +1,38 @@
+from typing import Dict, FrozenSet, Any, Optional
+
+from discord import Member
+
+
+class KaraokeEntityCache:
+    def __init__(self):
+        self.entities: Dict[int, Any] = dict()
+        self.member_roles: Dict[int, FrozenSet[int]] = dict()
+        # Without the members intent there are no on_member_update events to invalidate member roles
+        self.track_members = False
+
+    def get(self, entity_id: Optional[int]) -> Any:
+        return self.entities.get(entity_id) if entity_id else None
+
+    def put(self, entity: Any) -> Any:
+        if entity:
+            self.entities[entity.id] = entity
+        return entity
+
+    def roles(self, member: Member) -> FrozenSet[int]:
+        roles = self.member_roles.get(member.id)
+        if roles is None:
+            roles = frozenset(role.id for role in getattr(member, 'roles', []))
+            if self.track_members:
+                self.member_roles[member.id] = roles
+        return roles
+
+    def invalidate(self, entity_id: int):
+        if self.entities.pop(entity_id, None) is not None:
+            self.member_roles.clear()
+
+    def invalidate_member(self, member_id: int):
+        self.member_roles.pop(member_id, None)
+
+    def clear(self):
+        self.entities.clear()
+        self.member_roles.clear()
@@ -0,0 +1,394 @@
+import asyncio
+import logging
+import time
+from typing import List, Dict, Optional
+
+import discord
+from discord import VoiceState, Member, Role, Message, Guild
+from discord.abc import GuildChannel, User
+from discord.ext import commands
+from discord.ext.commands import Bot, AutoShardedBot, Context
+from aiohttp import web
+
+from .decorators import direct_message, allowed_guilds
+from .karaoke_bot import KaraokeBot
+from .karaoke_bot_config import KaraokeBotConfig
+from .karaoke_metrics import KaraokeMetrics, KaraokeRateLimitLog, KaraokeSampler, rss_bytes
+from .karaoke_pages import paginate, MESSAGE_LIMIT
+from .karaoke_responses import KaraokeConfigError
+
+logger = logging.getLogger(__name__)
+
+
+# One gateway connection serving every karaoke event, commands and events are routed to the event they belong to.
+class KaraokeCluster:
+    def __init__(self, tenants: List[KaraokeBot], sharded: bool = False):
+        self.tenants = tenants
+        self.sharded = sharded
+        self.bot: Bot = None
+        self.guilds: Dict[int, List[KaraokeBot]] = dict()
+        self.metrics = KaraokeMetrics()
+        self.metrics_runner: Optional[web.AppRunner] = None
+        self.started_at = time.perf_counter()
+        self.startup: Optional[Dict[str, float]] = None
+        self.measure_startup = False
+
+        self.metrics.gauge('karaoke_startup_seconds', lambda: self.startup['seconds'] if self.startup else 0)
+        self.metrics.gauge('karaoke_rss_bytes', rss_bytes)
+        self.metrics.gauge('karaoke_cached_members', self.cached_members)
+        self.metrics.gauge('karaoke_cached_messages', lambda: len(self.bot.cached_messages) if self.bot else 0)
+
+        for tenant in tenants:
+            self.guilds.setdefault(tenant.config.guild_id, []).append(tenant)
+            tenant.use_metrics(self.metrics)
+
+            labels = (('guild', str(tenant.config.guild_id)), ('event', tenant.config.voice_channel_name))
+            self.metrics.gauge('karaoke_queue_length', lambda tenant=tenant: len(tenant.queue), labels)
+            self.metrics.gauge('karaoke_log_size', lambda tenant=tenant: len(tenant.log), labels)
+            # 0 until a timed performance has finished
+            self.metrics.gauge('karaoke_performance_average_seconds',
+                               lambda tenant=tenant: round(tenant.log.average_duration or 0, 1), labels)
+            self.metrics.gauge('karaoke_performances_per_hour',
+                               lambda tenant=tenant: round(tenant.log.throughput_per_hour or 0, 2), labels)
+            self.metrics.gauge('karaoke_participants', lambda tenant=tenant: len(tenant.participants), labels)
+            self.metrics.gauge('karaoke_participants_peak', lambda tenant=tenant: tenant.participants.peak, labels)
+            self.metrics.gauge('karaoke_participant_joins', lambda tenant=tenant: tenant.participants.total_joins,
+                               labels)
+            self.metrics.gauge('karaoke_participant_leaves', lambda tenant=tenant: tenant.participants.total_leaves,
+                               labels)
+            # Over the last participants window
+            self.metrics.gauge('karaoke_participant_joins_per_minute',
+                               lambda tenant=tenant: round(tenant.participants.joins_per_minute, 2), labels)
+            self.metrics.gauge('karaoke_participant_leaves_per_minute',
+                               lambda tenant=tenant: round(tenant.participants.leaves_per_minute, 2), labels)
+            self.metrics.gauge('karaoke_actor_backlog', lambda tenant=tenant: len(tenant.actor), labels)
+            self.metrics.gauge('karaoke_timers_pending', lambda tenant=tenant: len(tenant.scheduler), labels)
+
+    @classmethod
+    def from_path(cls, path: str, sharded: bool = None):
+        configs = KaraokeBotConfig.from_path(path)
+        return cls([KaraokeBot(config) for config in configs],
+                   sharded=any(config.sharded for config in configs) if sharded is None else sharded)
+
+    @property
+    def config(self) -> KaraokeBotConfig:
+        return self.tenants[0].config
+
+    def gateway_options(self) -> dict:
+        if self.config.gateway_profile == 'default':
+            intents = discord.Intents.default()
+            options = dict()
+        else:
+            # Only what the events use: channels and roles, voice states, commands in the guilds and in DMs
+            intents = discord.Intents.none()
+            intents.guilds = intents.voice_states = intents.guild_messages = intents.dm_messages = True
+            intents.members = self.config.gateway_profile == 'members'
+            # Members are cached from voice states, event guilds are chunked on demand, command arguments and
+            # authors come with the message or are queried one by one
+            options = dict(member_cache_flags=discord.MemberCacheFlags.from_intents(intents),
+                           chunk_guilds_at_startup=False, max_messages=None)
+
+        if self.config.gateway_max_messages is not None:
+            options['max_messages'] = self.config.gateway_max_messages or None
+        return dict(intents=intents, **options)
+
+    def cached_members(self) -> int:
+        return sum(len(guild.members) for guild in self.bot.guilds) if self.bot else 0
+
+    def startup_stats(self) -> Dict[str, float]:
+        return {
+            'seconds': time.perf_counter() - self.started_at,
+            'rss_bytes': rss_bytes(),
+            'guilds': len(self.bot.guilds),
+            'members': self.cached_members(),
+            'users': len(self.bot.users),
+            'messages': len(self.bot.cached_messages),
+        }
+
+    def guild_tenants(self, guild: Optional[Guild]) -> List[KaraokeBot]:
+        return self.guilds.get(guild.id, []) if guild else []
+
+    def tenant_for_channel(self, channel: GuildChannel, event: str = None) -> Optional[KaraokeBot]:
+        tenants = self.guild_tenants(channel.guild)
+        if event:
+            event = event.casefold()
+            for tenant in tenants:
+                if event in (tenant.config.voice_channel_name.casefold(), tenant.config.text_channel_name.casefold()):
+                    return tenant
+            return None
+
+        for tenant in tenants:
+            if tenant.is_event_channel(channel):
+                return tenant
+        # Outside of the event channels only the single event of the guild is implied
+        return tenants[0] if len(tenants) == 1 else None
+
+    def tenant_for_user(self, user: User) -> KaraokeBot:
+        for tenant in self.tenants:
+            if tenant.is_user_in_event(user) or user in tenant.queue:
+                return tenant
+        return self.tenants[0]
+
+    def tenant(self, ctx: Context, event: str = None) -> Optional[KaraokeBot]:
+        if ctx.guild:
+            return self.tenant_for_channel(ctx.channel, event)
+        return self.tenant_for_user(ctx.author)
+
+    async def event_tenant(self, ctx: Context, event: str = None) -> Optional[KaraokeBot]:
+        tenant = self.tenant(ctx, event)
+        if not tenant:
+            tenants = self.guild_tenants(ctx.guild)
+            events = ', '.join(tenant.config.voice_channel_name for tenant in tenants)
+            await ctx.channel.send(tenants[0].config.render('choose_event', events=events))
+            return None
+        # admin_only passes an admin of any event of the guild, the chosen one may have another admin role
+        if not tenant.is_admin_user(ctx.author):
+            raise commands.CheckFailure(f'{ctx.author} is not an admin of {tenant.config.voice_channel_name}')
+        return tenant
+
+    def command_prefix(self, bot: Bot, message: Message) -> List[str]:
+        tenants = self.guild_tenants(message.guild) or self.tenants
+        return list(dict.fromkeys(tenant.config.command_prefix for tenant in tenants))
+
+    def admin_only(self):
+        def predicate(ctx):
+            tenant = self.tenant(ctx)
+            tenants = [tenant] if tenant else self.guild_tenants(ctx.guild)
+            return any(tenant.is_admin_user(ctx.author) for tenant in tenants)
+
+        return commands.check(predicate)
+
+    def event_channels_only(self):
+        def predicate(ctx):
+            tenant = self.tenant(ctx)
+            return bool(tenant) and tenant.is_event_channel(ctx.channel)
+
+        return commands.check(predicate)
+
+    def reload_config(self):
+        tenants: Dict[str, List[KaraokeBot]] = dict()
+        for tenant in self.tenants:
+            if not tenant.config.path:
+                raise KaraokeConfigError('the bot was not started from a config file')
+            tenants.setdefault(tenant.config.path, []).append(tenant)
+
+        # Every file is loaded and validated before any tenant is touched
+        configs = {path: KaraokeBotConfig.from_file(path) for path in tenants}
+        for path, path_tenants in tenants.items():
+            if [tenant.config.guild_id for tenant in path_tenants] != [config.guild_id for config in configs[path]]:
+                raise KaraokeConfigError(f'{path}: guilds and events can only be changed with a restart')
+
+        for path, path_tenants in tenants.items():
+            for tenant, config in zip(path_tenants, configs[path]):
+                tenant.reload(config)
+
+    async def broadcast(self, tenants: List[KaraokeBot], event: str, *args):
+        with self.metrics.measure('karaoke_event_seconds', event=event):
+            await asyncio.gather(*[getattr(tenant, event)(*args) for tenant in tenants])
+
+    def instrument(self):
+        async def before_invoke(ctx: Context):
+            ctx.karaoke_timer = self.metrics.measure('karaoke_command_seconds', command=ctx.command.name).__enter__()
+
+        async def after_invoke(ctx: Context):
+            timer = getattr(ctx, 'karaoke_timer', None)
+            if timer:
+                timer.__exit__(None, None, None)
+
+        self.bot.before_invoke(before_invoke)
+        self.bot.after_invoke(after_invoke)
+
+        request = self.bot.http.request
+
+        async def instrumented_request(route, **kwargs):
+            with self.metrics.measure('karaoke_api_seconds', method=route.method, route=route.path):
+                return await request(route, **kwargs)
+
+        self.bot.http.request = instrumented_request
+        KaraokeRateLimitLog.install(self.metrics)
+
+    async def start_metrics(self):
+        if self.config.metrics_port and not self.metrics_runner:
+            self.metrics_runner = await self.metrics.serve(self.config.metrics_host, self.config.metrics_port)
+        if self.config.metrics_profile_interval and not self.metrics.sampler:
+            self.metrics.sampler = KaraokeSampler(self.config.metrics_profile_interval)
+            self.metrics.sampler.start()
+
+    def __define_handlers(self):
+        @self.bot.event
+        async def on_ready():
+            await self.start_metrics()
+            await self.broadcast(self.tenants, 'on_ready')
+
+            # Later on_ready events follow reconnects
+            if not self.startup:
+                self.startup = self.startup_stats()
+                logger.info('Ready in %.3fs, %s', self.startup['seconds'],
+                            ', '.join(f'{key}={value}' for key, value in self.startup.items() if key != 'seconds'))
+                if self.measure_startup:
+                    await self.bot.close()
+
+        @self.bot.event
+        async def on_command_error(ctx: Context, error: commands.CommandError):
+            command = ctx.command.name if ctx.command else ''
+            self.metrics.inc('karaoke_command_errors_total', (('command', command), ('error', type(error).__name__)))
+            await type(self.bot).on_command_error(self.bot, ctx, error)
+
+        @self.bot.event
+        async def on_resumed():
+            await self.broadcast(self.tenants, 'on_resumed')
+
+        @self.bot.event
+        async def on_guild_available(guild: Guild):
+            await self.broadcast(self.guild_tenants(guild), 'on_guild_available', guild)
+
+        @self.bot.event
+        async def on_guild_unavailable(guild: Guild):
+            await self.broadcast(self.guild_tenants(guild), 'on_guild_unavailable', guild)
+
+        @self.bot.event
+        async def on_guild_role_update(before: Role, after: Role):
+            await self.broadcast(self.guild_tenants(after.guild), 'on_guild_role_update', before, after)
+
+        @self.bot.event
+        async def on_guild_role_delete(role: Role):
+            await self.broadcast(self.guild_tenants(role.guild), 'on_guild_role_delete', role)
+
+        @self.bot.event
+        async def on_guild_channel_update(before: GuildChannel, after: GuildChannel):
+            await self.broadcast(self.guild_tenants(after.guild), 'on_guild_channel_update', before, after)
+
+        @self.bot.event
+        async def on_guild_channel_delete(channel: GuildChannel):
+            await self.broadcast(self.guild_tenants(channel.guild), 'on_guild_channel_delete', channel)
+
+        @self.bot.event
+        async def on_member_update(before: Member, after: Member):
+            await self.broadcast(self.guild_tenants(after.guild), 'on_member_update', before, after)
+
+        @self.bot.event
+        async def on_voice_state_update(member: Member, before: VoiceState, after: VoiceState):
+            await self.broadcast(self.guild_tenants(member.guild), 'on_voice_state_update', member, before, after)
+
+        @self.bot.command(name=self.config.commands['add_me_to_queue'])
+        @direct_message()
+        async def add_me_to_queue(ctx: Context, comment: str = None):
+            await self.tenant(ctx).add_me_to_queue(ctx, comment)
+
+        @self.bot.command(name=self.config.commands['show_log_of_artists'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        async def show_log_of_artists(ctx: Context, page: int = 1, event: str = None):
+            tenant = await self.event_tenant(ctx, event)
+            if tenant:
+                await tenant.show_log_of_artists(ctx, page)
+
+        @self.bot.command(name=self.config.commands['show_queue_of_artists'])
+        async def show_queue_of_artists(ctx: Context, page: int = 1):
+            tenant = self.tenant(ctx)
+            if tenant:
+                await tenant.show_queue_of_artists(ctx, page)
+
+        @self.bot.command(name=self.config.commands['start_performance'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        @self.event_channels_only()
+        async def start_performance(ctx: Context):
+            await self.tenant(ctx).start_performance(ctx)
+
+        @self.bot.command(name=self.config.commands['finish_performance'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        @self.event_channels_only()
+        async def finish_performance(ctx: Context):
+            await self.tenant(ctx).finish_performance(ctx)
+
+        @self.bot.command(name=self.config.commands['skip_performance'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        @self.event_channels_only()
+        async def skip_performance(ctx: Context, member: discord.Member, comment: str = None):
+            await self.tenant(ctx).skip_performance(ctx, member, comment)
+
+        @self.bot.command(name=self.config.commands['confirm_ready'])
+        @direct_message()
+        async def confirm_ready(ctx: Context):
+            await self.tenant(ctx).confirm_ready(ctx)
+
+        @self.bot.command(name=self.config.commands['remove_me_from_queue'])
+        @direct_message()
+        async def remove_me_from_queue(ctx: Context, comment: str = None):
+            await self.tenant(ctx).remove_me_from_queue(ctx, comment)
+
+        @self.bot.command(name=self.config.commands['stop'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        async def stop_karaoke(ctx: Context, event: str = None):
+            tenant = await self.event_tenant(ctx, event)
+            if tenant:
+                await tenant.stop_karaoke(ctx)
+
+        @self.bot.command(name=self.config.commands['start'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        async def start_karaoke(ctx: Context, event: str = None):
+            tenant = await self.event_tenant(ctx, event)
+            if tenant:
+                await tenant.start_karaoke(ctx)
+
+        @self.bot.command(name=self.config.commands['mute_room'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        @self.event_channels_only()
+        async def mute_room(ctx: Context):
+            await self.tenant(ctx).mute_room(ctx)
+
+        @self.bot.command(name=self.config.commands['unmute_room'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        @self.event_channels_only()
+        async def unmute_room(ctx: Context):
+            await self.tenant(ctx).unmute_room(ctx)
+
+        @self.bot.command(name=self.config.commands['show_stats'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        async def show_stats(ctx: Context):
+            for page in paginate(self.metrics.summary(), '\n', MESSAGE_LIMIT - 8):
+                await ctx.channel.send(f'```\n{page}\n```')
+
+        @self.bot.command(name=self.config.commands['reload_config'])
+        @self.admin_only()
+        @allowed_guilds(list(self.guilds))
+        async def reload_config(ctx: Context):
+            # The reload is not bound to an event, any event of the guild answers
+            config = (self.tenant(ctx) or self.guild_tenants(ctx.guild)[0]).config
+            try:
+                self.reload_config()
+            except (OSError, ValueError, KeyError) as error:
+                self.metrics.inc('karaoke_config_reloads_total', (('result', 'failed'),))
+                error = str(error) if isinstance(error, KaraokeConfigError) else f'{type(error).__name__}: {error}'
+                message = config.render('config_reload_failed', error=error)
+                await ctx.channel.send(message[:MESSAGE_LIMIT])
+            else:
+                self.metrics.inc('karaoke_config_reloads_total', (('result', 'reloaded'),))
+                await ctx.channel.send(config.render('config_has_been_reloaded'))
+
+    def run(self, token: str, measure_startup: bool = False):
+        # With measure_startup the bot disconnects once ready, startup holds the time to ready and the caches
+        self.measure_startup = measure_startup
+        self.started_at = time.perf_counter()
+        self.bot = (AutoShardedBot if self.sharded else Bot)(command_prefix=self.command_prefix,
+                                                             **self.gateway_options())
+        for tenant in self.tenants:
+            tenant.bot = self.bot
+        self.__define_handlers()
+        self.instrument()
+
+        try:
+            self.bot.run(token)
+        finally:
+            for tenant in self.tenants:
+                tenant.close()
+            if self.metrics.sampler:
+                self.metrics.sampler.stop()
@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+import time
+from collections import deque, Counter
+from itertools import islice
+from typing import Deque, Iterator, Optional, Iterable, Tuple, TextIO, List
+
+FINISHED = 'finished'
+SKIPPED = 'skipped'
+
+
+class KaraokeHistoryRecord:
+    __slots__ = ('user_id', 'comment', 'started_at', 'finished_at', 'outcome')
+
+    def __init__(self, user_id: int, comment: str = None, started_at: float = None, finished_at: float = None,
+                 outcome: str = FINISHED):
+        self.user_id = user_id
+        self.comment = sys.intern(comment) if comment else None
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.outcome = outcome
+
+    @property
+    def mention(self) -> str:
+        return f'<@{self.user_id}>'
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def to_tuple(self) -> Tuple[int, Optional[str], Optional[float], Optional[float], str]:
+        return self.user_id, self.comment, self.started_at, self.finished_at, self.outcome
+
+
+# The last `capacity` records stay in memory, older ones are spilled to a json lines segment on disk.
+# Aggregates cover the whole history, spilled records included.
+class KaraokeHistory:
+    def __init__(self, capacity: int = 1000, segment_path: str = None):
+        self.capacity = capacity
+        self.segment_path = segment_path
+        self.segment: Optional[TextIO] = None
+        self.records: Deque[KaraokeHistoryRecord] = deque()
+        self.spilled = 0
+        self.version = 0
+        self.counts: Counter = Counter()
+        self.outcomes: Counter = Counter()
+        self.total_duration = 0.0
+        self.timed = 0
+        self.first_started_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self.spilled + len(self.records)
+
+    def __bool__(self) -> bool:
+        return bool(self.records) or bool(self.spilled)
+
+    def __iter__(self) -> Iterator[KaraokeHistoryRecord]:
+        return iter(self.records)
+
+    def recent(self, count: int) -> List[KaraokeHistoryRecord]:
+        return list(islice(reversed(self.records), count))
+
+    def append(self, user_id: int, comment: str = None, started_at: float = None, finished_at: float = None,
+               outcome: str = FINISHED) -> KaraokeHistoryRecord:
+        record = KaraokeHistoryRecord(user_id, comment, started_at, finished_at or time.time(), outcome)
+        self.__count(record)
+        self.records.append(record)
+        while len(self.records) > self.capacity:
+            self.__spill(self.records.popleft())
+        self.version += 1
+
+        return record
+
+    def restore(self, records: Iterable[Tuple]):
+        if self.segment_path and os.path.exists(self.segment_path):
+            with open(self.segment_path, encoding='utf-8') as f:
+                for line in f:
+                    self.__count(KaraokeHistoryRecord(*json.loads(line)))
+                    self.spilled += 1
+
+        records = [KaraokeHistoryRecord(*record) for record in records]
+        tail = records[-self.capacity:] if self.capacity else []
+        # Records older than the in-memory tail have already been spilled to the segment before the restart
+        if not self.segment_path:
+            for record in records[:len(records) - len(tail)]:
+                self.__count(record)
+                self.spilled += 1
+        for record in tail:
+            self.__count(record)
+
+        self.records = deque(tail)
+        self.version += 1
+
+    def count(self, user_id: int) -> int:
+        return self.counts[user_id]
+
+    @property
+    def average_duration(self) -> Optional[float]:
+        return self.total_duration / self.timed if self.timed else None
+
+    @property
+    def throughput_per_hour(self) -> Optional[float]:
+        if self.first_started_at is None or not self.records:
+            return None
+        hours = (self.records[-1].finished_at - self.first_started_at) / 3600
+        return self.outcomes[FINISHED] / hours if hours > 0 else None
+
+    def clear(self):
+        self.close()
+        if self.segment_path and os.path.exists(self.segment_path):
+            os.remove(self.segment_path)
+
+        self.records.clear()
+        self.spilled = 0
+        self.counts.clear()
+        self.outcomes.clear()
+        self.total_duration = 0.0
+        self.timed = 0
+        self.first_started_at = None
+        self.version += 1
+
+    def close(self):
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+
+    def __count(self, record: KaraokeHistoryRecord):
+        # Songs sung by the user, skipped ones do not move the user back in a least_sung queue
+        if record.outcome == FINISHED:
+            self.counts[record.user_id] += 1
+        self.outcomes[record.outcome] += 1
+        if record.duration is not None:
+            self.total_duration += record.duration
+            self.timed += 1
+        if self.first_started_at is None:
+            self.first_started_at = record.finished_at if record.started_at is None else record.started_at
+
+    def __spill(self, record: KaraokeHistoryRecord):
+        self.spilled += 1
+        if not self.segment_path:
+            return
+
+        if not self.segment:
+            os.makedirs(os.path.dirname(self.segment_path) or '.', exist_ok=True)
+            self.segment = open(self.segment_path, 'a', encoding='utf-8')
+        self.segment.write(json.dumps(record.to_tuple(), ensure_ascii=False) + '\n')
+        self.segment.flush()
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import List, Tuple, Optional, TextIO, Dict, Deque
+
+from .karaoke_history import FINISHED, SKIPPED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class KaraokeJournalState:
+    queue: List[Tuple[int, Optional[str], int]] = field(default_factory=list)
+    log: List[Tuple] = field(default_factory=list)
+    # User and start time of the performance going on
+    performance: Optional[Tuple[int, float]] = None
+
+
+# Songs in the order they were queued, records refer to the earliest pending song of a user
+class KaraokeReplayQueue:
+    def __init__(self):
+        self.songs: OrderedDict = OrderedDict()
+        self.users: Dict[int, Deque[int]] = dict()
+        self.seq = 0
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.users
+
+    def __bool__(self) -> bool:
+        return bool(self.songs)
+
+    def add(self, user_id: int, comment: Optional[str], song_round: int = 0):
+        self.songs[self.seq] = (user_id, comment, song_round)
+        self.users.setdefault(user_id, deque()).append(self.seq)
+        self.seq += 1
+
+    def take(self, user_id: int) -> Tuple[int, Optional[str]]:
+        keys = self.users[user_id]
+        user_id, comment, _ = self.songs.pop(keys.popleft())
+        if not keys:
+            del self.users[user_id]
+        return user_id, comment
+
+    def clear(self):
+        self.songs.clear()
+        self.users.clear()
+
+    def items(self) -> List[Tuple[int, Optional[str], int]]:
+        return list(self.songs.values())
+
+
+# Queue mutations are appended to journal.jsonl and fsynced in batches, snapshot.json holds the compacted state.
+# Recovery loads the snapshot and replays only the journal records written after it. Commands only buffer records,
+# writes, fsyncs and snapshots run in order on a single writer thread.
+class KaraokeJournal:
+    def __init__(self, path: str, fsync_interval: float = 1.0, batch_size: int = 256, snapshot_every: int = 1000):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = os.path.join(path, 'snapshot.json')
+        self.journal_path = os.path.join(path, 'journal.jsonl')
+        self.seq = 0
+        self.lines: List[str] = []
+        self.since_snapshot = 0
+        # Owned by the writer thread once recovered
+        self.file: Optional[TextIO] = None
+        self.sync_handle: Optional[asyncio.TimerHandle] = None
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='karaoke-journal')
+
+    @property
+    def needs_snapshot(self) -> bool:
+        return self.since_snapshot >= self.snapshot_every
+
+    def recover(self) -> KaraokeJournalState:
+        os.makedirs(self.path, exist_ok=True)
+        queue, log, performance = KaraokeReplayQueue(), [], None
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.seq = snapshot['seq']
+            for song in snapshot['queue']:
+                queue.add(*song)
+            log.extend(tuple(record) for record in snapshot['log'])
+            performance = snapshot.get('performance')
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb+') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError(line)
+                        seq, op, *args = json.loads(line)
+                    except ValueError:
+                        # Torn write of the last record before a crash
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if seq <= self.seq:
+                        continue
+
+                    self.seq = seq
+                    self.since_snapshot += 1
+                    # The performance ends with the song of its user leaving the queue
+                    if performance and op in ('remove', 'skip', 'pop') and args[0] == performance[0]:
+                        performance = None
+                    if op == 'perform':
+                        performance = args[0:2]
+                    elif op == 'add':
+                        queue.add(*args[0:3])
+                    elif op == 'remove' and args[0] in queue:
+                        queue.take(args[0])
+                    elif op == 'skip' and args[0] in queue:
+                        log.append((*queue.take(args[0]), *args[1:3], SKIPPED))
+                    elif op == 'pop' and args[0] in queue:
+                        log.append((*queue.take(args[0]), *args[1:3], FINISHED))
+                    elif op == 'clear':
+                        queue.clear()
+                        log.clear()
+                        performance = None
+
+        self.file = open(self.journal_path, 'a', encoding='utf-8')
+        return KaraokeJournalState(queue.items(), log, tuple(performance) if performance else None)
+
+    def append(self, op: str, *args):
+        self.seq += 1
+        self.lines.append(json.dumps([self.seq, op, *args], ensure_ascii=False) + '\n')
+        self.since_snapshot += 1
+
+        if len(self.lines) >= self.batch_size:
+            self.sync()
+        elif not self.sync_handle:
+            try:
+                self.sync_handle = asyncio.get_running_loop().call_later(self.fsync_interval, self.sync)
+            except RuntimeError:
+                pass
+
+    def sync(self):
+        if self.sync_handle:
+            self.sync_handle.cancel()
+            self.sync_handle = None
+
+        if self.file and self.lines:
+            lines, self.lines = self.lines, []
+            self.submit(self.write, lines)
+
+    def snapshot(self, state: KaraokeJournalState):
+        # The state is a copy made by the caller, the live queue keeps changing while it is written
+        self.sync()
+        self.since_snapshot = 0
+        self.submit(self.write_snapshot, self.seq, state)
+
+    def submit(self, fn, *args):
+        self.writer.submit(fn, *args).add_done_callback(self.report)
+
+    @staticmethod
+    def report(future: Future):
+        if future.exception():
+            logger.error('Failed to write the journal', exc_info=future.exception())
+
+    def write(self, lines: List[str]):
+        self.file.writelines(lines)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write_snapshot(self, seq: int, state: KaraokeJournalState):
+        temporary_path = self.snapshot_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump({'seq': seq, 'queue': state.queue, 'log': state.log, 'performance': state.performance}, f,
+                      ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+
+        # Records appended after the snapshot are submitted later and go to the new journal
+        self.file.close()
+        self.file = open(self.journal_path, 'w', encoding='utf-8')
+
+    def close(self):
+        self.sync()
+        self.writer.shutdown(wait=True)
+        if self.file:
+            self.file.close()
+            self.file = None
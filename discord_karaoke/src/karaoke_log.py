@@ -1,9 +0,0 @@
-from dataclasses import dataclass
-
-from discord import User
-
-
-@dataclass
-class KaraokeLog:
-    user: User
-    comment: str = None
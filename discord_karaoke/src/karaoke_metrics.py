@@ -0,0 +1,205 @@
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Tuple, Callable, List, Optional
+
+import discord.http
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{key}="{escape_label(value)}"' for key, value in labels] + ([extra] if extra else [])
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def rss_bytes() -> int:
+    # Current resident set size on Linux, the peak one elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class KaraokeHistogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return 0.0
+
+
+class KaraokeTimer:
+    __slots__ = ('metrics', 'name', 'labels', 'started_at')
+
+    def __init__(self, metrics: 'KaraokeMetrics', name: str, labels: Labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.started_at, self.labels)
+        if exc_type:
+            self.metrics.inc(self.name.replace('_seconds', '_errors_total'),
+                             self.labels + (('error', exc_type.__name__),))
+        return False
+
+
+class KaraokeMetrics:
+    def __init__(self):
+        self.counters: Dict[str, Counter] = dict()
+        self.histograms: Dict[str, Dict[Labels, KaraokeHistogram]] = dict()
+        self.gauges: Dict[str, Dict[Labels, Callable[[], float]]] = dict()
+        self.sampler: Optional[KaraokeSampler] = None
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        self.counters.setdefault(name, Counter())[labels] += value
+
+    def observe(self, name: str, value: float, labels: Labels = ()):
+        histograms = self.histograms.setdefault(name, dict())
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = KaraokeHistogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, getter: Callable[[], float], labels: Labels = ()):
+        self.gauges.setdefault(name, dict())[labels] = getter
+
+    def measure(self, name: str, **labels: str) -> KaraokeTimer:
+        return KaraokeTimer(self, name, tuple(labels.items()))
+
+    def render(self) -> str:
+        lines = []
+        for name, counter in sorted(self.counters.items()):
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{format_labels(labels)} {value}' for labels, value in counter.items()]
+        for name, gauges in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines += [f'{name}{format_labels(labels)} {getter()}' for labels, getter in gauges.items()]
+        for name, histograms in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in histograms.items():
+                cumulative = 0
+                for bucket, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = 'le="{}"'.format('+Inf' if bucket == float('inf') else repr(bucket))
+                    lines.append(f'{name}_bucket{format_labels(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> List[str]:
+        lines = []
+        for name, gauges in sorted(self.gauges.items()):
+            lines += [f'{name}{format_labels(labels)} {getter()}' for labels, getter in gauges.items()]
+        for name, histograms in sorted(self.histograms.items()):
+            for labels, histogram in sorted(histograms.items(), key=lambda item: -item[1].count):
+                lines.append(f'{name}{format_labels(labels)} n={histogram.count} '
+                             f'avg={histogram.sum / histogram.count * 1000:.1f}ms '
+                             f'p95<={histogram.quantile(0.95) * 1000:.0f}ms max={histogram.max * 1000:.1f}ms')
+        for name, counter in sorted(self.counters.items()):
+            lines += [f'{name}{format_labels(labels)} {value:g}' for labels, value in counter.items()]
+        if self.sampler:
+            lines += [f'profile {count} {frame}' for frame, count in self.sampler.samples.most_common(10)]
+        return lines
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        async def handle(request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+        application = web.Application()
+        application.router.add_get('/metrics', handle)
+        runner = web.AppRunner(application)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+# Messages of discord.http about rate limit waits: the start of the message, the argument holding the wait in
+# seconds and the source it is counted under. An exhausted bucket is only logged at debug level.
+RATE_LIMIT_MESSAGES = (
+    ('A rate limit bucket has been exhausted', 1, 'http'),
+    ('We are being rate limited', 0, 'http'),
+    ('Global rate limit has been hit', 0, 'global'),
+)
+
+
+# Stands in for the `discord.http` module logger and counts the rate limit waits it reports, whatever level the
+# logger is enabled for, before passing the records on unchanged
+class KaraokeRateLimitLog(logging.LoggerAdapter):
+    def __init__(self, logger: logging.Logger, metrics: KaraokeMetrics):
+        super().__init__(logger, None)
+        self.metrics = metrics
+
+    @classmethod
+    def install(cls, metrics: KaraokeMetrics, module=discord.http) -> 'KaraokeRateLimitLog':
+        log = module.log
+        module.log = cls(getattr(log, 'logger', log), metrics)
+        return module.log
+
+    def log(self, level: int, msg, *args, **kwargs):
+        if isinstance(msg, str):
+            for prefix, index, source in RATE_LIMIT_MESSAGES:
+                if msg.startswith(prefix) and len(args) > index and isinstance(args[index], (int, float)):
+                    self.metrics.inc('karaoke_rate_limit_wait_seconds_total', (('source', source),), args[index])
+                    break
+        super().log(level, msg, *args, **kwargs)
+
+
+# Samples the innermost frame of the event loop thread from a background thread
+class KaraokeSampler(threading.Thread):
+    def __init__(self, interval: float, thread_id: int = None):
+        super().__init__(name='karaoke-sampler', daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame:
+                self.samples[f'{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}'] += 1
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import List, Dict, Set, Iterable, Optional, Callable
+
+import discord
+from discord import Member, VoiceChannel, PermissionOverwrite, Object
+
+from .karaoke_metrics import KaraokeMetrics
+
+logger = logging.getLogger(__name__)
+
+
+# Gives the floor to the artist either by server muting members one by one (mute) or by speak grants in the
+# overwrites of the voice channel, where any transition is a single channel edit (overwrites).
+class KaraokeMic:
+    def __init__(self, mode: str = 'mute', concurrency: int = 4, metrics: KaraokeMetrics = None):
+        self.mode = mode
+        self.concurrency = concurrency
+        self.metrics = metrics
+        # Members granted to speak by the bot and members whose overwrites the bot manages
+        self.granted: Dict[int, Member] = dict()
+        self.managed: Set[int] = set()
+        # What mute_room took away, for restore to give back
+        self.room_muted: Dict[int, Member] = dict()
+        self.lock: Optional[asyncio.Lock] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    async def switch(self, channel: VoiceChannel, unmute: List[Member], mute: List[Member or Object]):
+        # Members to mute may have left the voice channel, their grants are revoked by id all the same
+        if self.mode == 'overwrites':
+            def change(granted: Dict[int, Member]) -> Dict[int, Member]:
+                muted = {member.id for member in mute}
+                granted = {member_id: member for member_id, member in granted.items() if member_id not in muted}
+                granted.update((member.id, member) for member in unmute)
+                return granted
+
+            await self.grant(channel, change)
+        else:
+            await self.set_mute([(member, False) for member in unmute] + [(member, True) for member in mute])
+
+    async def mute_room(self, channel: VoiceChannel, members: Iterable[Member], keep: Set[int]):
+        if self.mode == 'overwrites':
+            def change(granted: Dict[int, Member]) -> Dict[int, Member]:
+                self.room_muted.update((member_id, member) for member_id, member in granted.items()
+                                       if member_id not in keep)
+                return {member_id: member for member_id, member in granted.items() if member_id in keep}
+
+            await self.grant(channel, change)
+        else:
+            targets = [member for member in members if member.id not in keep and not self.is_muted(member)]
+            self.room_muted.update((member.id, member) for member in targets)
+            await self.set_mute([(member, True) for member in targets])
+
+    async def restore(self, channel: VoiceChannel):
+        room_muted, self.room_muted = self.room_muted, dict()
+        if self.mode == 'overwrites':
+            await self.grant(channel, lambda granted: {**granted, **room_muted})
+        else:
+            await self.set_mute([(member, False) for member in room_muted.values()])
+
+    def reset(self):
+        # The voice channel with the overwrites is gone
+        self.granted.clear()
+        self.managed.clear()
+        self.room_muted.clear()
+
+    @staticmethod
+    def is_muted(member: Member) -> bool:
+        voice = getattr(member, 'voice', None)
+        return bool(voice and voice.mute)
+
+    async def set_mute(self, changes: List[tuple]):
+        if not self.semaphore:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def change(member: Member, muted: bool):
+            # Members who left the voice channel can't be server muted
+            if not getattr(member, 'voice', None) or self.is_muted(member) == muted:
+                self.count('skip')
+                return
+            async with self.semaphore:
+                try:
+                    await member.edit(mute=muted)
+                    self.count('mute' if muted else 'unmute')
+                except discord.HTTPException as error:
+                    logger.warning('Failed to change mic of %s: %s', member.id, error)
+                    self.count('error')
+
+        await asyncio.gather(*[change(member, muted) for member, muted in changes])
+
+    async def grant(self, channel: VoiceChannel, change: Callable[[Dict[int, Member]], Dict[int, Member]]):
+        if not self.lock:
+            self.lock = asyncio.Lock()
+
+        # Channel overwrites in the cache are updated by the gateway later, edits are serialized on our own state
+        async with self.lock:
+            granted = change(self.granted)
+            if not channel or granted.keys() == self.granted.keys():
+                self.count('skip')
+                self.granted = granted
+                return
+
+            self.managed.update(granted)
+            overwrites = {target: overwrite for target, overwrite in channel.overwrites.items()
+                          if target.id not in self.managed}
+            overwrites.update((member, PermissionOverwrite(speak=True)) for member in granted.values())
+            try:
+                await channel.edit(overwrites=overwrites)
+                self.granted = granted
+                self.count('overwrite')
+            except discord.HTTPException as error:
+                logger.warning('Failed to change speak overwrites of %s: %s', channel.id, error)
+                self.count('error')
+
+    def count(self, action: str):
+        if self.metrics:
+            self.metrics.inc('karaoke_mic_changes_total', (('mode', self.mode), ('action', action)))
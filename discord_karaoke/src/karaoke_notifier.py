@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Iterable
+
+import discord
+from discord.abc import Messageable
+
+from .karaoke_metrics import KaraokeMetrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class KaraokeNotification:
+    destination: Messageable
+    content: str
+
+
+@dataclass
+class KaraokeNotificationFailure:
+    notification: KaraokeNotification
+    error: Exception
+
+
+class KaraokeRateLimit:
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate / self.per)
+            self.updated_at = now
+
+            delay = 0.0
+            if self.tokens < 1:
+                delay = (1 - self.tokens) * self.per / self.rate
+                await asyncio.sleep(delay)
+                self.tokens, self.updated_at = 1.0, time.monotonic()
+
+            self.tokens -= 1
+            return delay
+
+
+# Messages of one route (user DM or channel) are sent in order, routes are sent concurrently.
+class KaraokeNotifier:
+    def __init__(self, rate: int = 5, per: float = 5.0, metrics: KaraokeMetrics = None):
+        self.rate = rate
+        self.per = per
+        self.metrics = metrics
+        self.limits: Dict[int, KaraokeRateLimit] = dict()
+
+    @staticmethod
+    def route(destination: Messageable) -> int:
+        return getattr(destination, 'id', None) or id(destination)
+
+    def limit(self, route: int) -> KaraokeRateLimit:
+        if route not in self.limits:
+            self.limits[route] = KaraokeRateLimit(self.rate, self.per)
+        return self.limits[route]
+
+    async def dispatch(self, notifications: Iterable[KaraokeNotification]) -> List[KaraokeNotificationFailure]:
+        routes: Dict[int, List[KaraokeNotification]] = dict()
+        for notification in notifications:
+            if notification.destination:
+                routes.setdefault(self.route(notification.destination), []).append(notification)
+
+        results = await asyncio.gather(*[self.send_route(route, items) for route, items in routes.items()])
+        return [failure for failures in results for failure in failures]
+
+    async def send_route(self, route: int, notifications: List[KaraokeNotification]) -> List[
+            KaraokeNotificationFailure]:
+        failures = []
+        limit = self.limit(route)
+
+        for notification in notifications:
+            waited = await limit.acquire()
+            if waited and self.metrics:
+                self.metrics.inc('karaoke_rate_limit_wait_seconds_total', (('source', 'notifier'),), waited)
+
+            try:
+                await notification.destination.send(notification.content)
+            except discord.HTTPException as error:
+                logger.warning('Failed to notify %s: %s', route, error)
+                failures.append(KaraokeNotificationFailure(notification, error))
+                if self.metrics:
+                    self.metrics.inc('karaoke_notification_failures_total', (('error', type(error).__name__),))
+
+        return failures
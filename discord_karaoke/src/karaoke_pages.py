@@ -0,0 +1,56 @@
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Hashable
+
+MESSAGE_LIMIT = 2000
+
+
+def paginate(lines: List[str], delimiter: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    pages, page = [], ''
+
+    for line in lines:
+        line = line[:limit]
+        if page and len(page) + len(delimiter) + len(line) > limit:
+            pages.append(page)
+            page = ''
+        page = page + delimiter + line if page else line
+
+    if page:
+        pages.append(page)
+    return pages
+
+
+# Rendered pages are reused until the version changes, lines are reused while their index and content stay the same.
+class KaraokePages:
+    def __init__(self, render: Callable[[int, Any, str], str], limit: int = MESSAGE_LIMIT):
+        self.render = render
+        self.limit = limit
+        self.version = None
+        self.lines: Dict[Hashable, Tuple[int, Any, str, str]] = dict()
+        self.pages: List[str] = []
+
+    def get(self, version: Any, entries: Iterable[Tuple[Hashable, Any, str]], delimiter: str,
+            footer: str = '', start: int = 0) -> List[str]:
+        if version != self.version:
+            self.pages = self.paginate(self.render_lines(entries, start), delimiter, len(footer) + 16)
+            self.version = version
+        return self.pages
+
+    def render_lines(self, entries: Iterable[Tuple[Hashable, Any, str]], start: int = 0) -> List[str]:
+        lines = dict()
+
+        for index, (key, user, comment) in enumerate(entries, start):
+            cached = self.lines.get(key)
+            if cached and cached[0] == index and cached[1] is user and cached[2] == comment:
+                lines[key] = cached
+            else:
+                lines[key] = (index, user, comment, self.render(index + 1, user, comment))
+
+        self.lines = lines
+        return [line for _, _, _, line in lines.values()]
+
+    def paginate(self, lines: List[str], delimiter: str, reserve: int) -> List[str]:
+        return paginate(lines, delimiter, self.limit - reserve)
+
+    def clear(self):
+        self.version = None
+        self.lines.clear()
+        self.pages = []
@@ -0,0 +1,61 @@
+import time
+from collections import deque
+from typing import Dict, Deque, Iterable, Optional
+
+from discord import Member, User
+
+
+class KaraokeParticipants:
+    def __init__(self, window: float = 300.0):
+        self.window = window
+        self.members: Dict[int, Member] = dict()
+        self.joins: Deque[float] = deque()
+        self.leaves: Deque[float] = deque()
+        self.total_joins = 0
+        self.total_leaves = 0
+        self.peak = 0
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, user: User) -> bool:
+        return user.id in self.members
+
+    def get(self, member_id: int) -> Optional[Member]:
+        return self.members.get(member_id)
+
+    def join(self, member: Member):
+        if member.id not in self.members:
+            self.joins.append(time.monotonic())
+            self.total_joins += 1
+        self.members[member.id] = member
+        self.peak = max(self.peak, len(self.members))
+
+    def leave(self, member_id: int):
+        if self.members.pop(member_id, None):
+            self.leaves.append(time.monotonic())
+            self.total_leaves += 1
+
+    def rebuild(self, members: Iterable[Member]):
+        self.members = {member.id: member for member in members}
+        self.peak = max(self.peak, len(self.members))
+
+    def clear(self):
+        self.members.clear()
+        self.joins.clear()
+        self.leaves.clear()
+        self.total_joins = self.total_leaves = self.peak = 0
+
+    def __rate(self, events: Deque[float]) -> float:
+        threshold = time.monotonic() - self.window
+        while events and events[0] < threshold:
+            events.popleft()
+        return len(events) * 60 / self.window
+
+    @property
+    def joins_per_minute(self) -> float:
+        return self.__rate(self.joins)
+
+    @property
+    def leaves_per_minute(self) -> float:
+        return self.__rate(self.leaves)
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import discord
+from discord import Guild, Role, PermissionOverwrite, CategoryChannel, TextChannel, VoiceChannel
+from discord.abc import GuildChannel
+
+from .karaoke_bot_config import KaraokeBotConfig
+
+
+def find(get: Callable[[int], Any], collection: List[Any], entity_id: Optional[int], name: str) -> Any:
+    return (get(entity_id) if entity_id else None) or discord.utils.get(collection, name=name)
+
+
+# Diffs the layout of an event against the guild and issues only the missing calls, independent ones concurrently.
+class KaraokeProvisioner:
+    def __init__(self, config: KaraokeBotConfig):
+        self.config = config
+
+    @staticmethod
+    def text_overwrites(guild: Guild, admin_role: Role, member_role: Role) -> Dict[Any, PermissionOverwrite]:
+        return {
+            guild.default_role: PermissionOverwrite(read_messages=False, connect=False),
+            member_role: PermissionOverwrite(read_messages=True, send_messages=True, connect=True, speak=False),
+            admin_role: PermissionOverwrite(read_messages=True, send_messages=True, connect=True, speak=True),
+        }
+
+    @staticmethod
+    def voice_overwrites(guild: Guild, admin_role: Role, member_role: Role) -> Dict[Any, PermissionOverwrite]:
+        return {
+            guild.default_role: PermissionOverwrite(connect=True, speak=False),
+            member_role: PermissionOverwrite(connect=True, speak=False),
+            admin_role: PermissionOverwrite(connect=True, speak=True),
+        }
+
+    async def ensure_role(self, guild: Guild, id_attribute: str, name: str) -> Role:
+        role = find(guild.get_role, guild.roles, getattr(self.config, id_attribute), name)
+        if not role:
+            role = await guild.create_role(name=name)
+        setattr(self.config, id_attribute, role.id)
+        return role
+
+    async def define_roles(self, guild: Guild) -> Tuple[Role, Role]:
+        admin_role, member_role = await asyncio.gather(
+            self.ensure_role(guild, 'admin_role_id', self.config.admin_role_name),
+            self.ensure_role(guild, 'member_role_id', self.config.member_role_name))
+        return admin_role, member_role
+
+    async def ensure_category(self, guild: Guild) -> CategoryChannel:
+        category = discord.utils.get(guild.categories, name=self.config.category_name)
+        return category or await guild.create_category(self.config.category_name)
+
+    async def ensure_channel(self, guild: Guild, id_attribute: str, name: str, collection: List[GuildChannel],
+                             create: Callable, category: CategoryChannel,
+                             overwrites: Dict[Any, PermissionOverwrite]) -> GuildChannel:
+        channel = find(guild.get_channel, collection, getattr(self.config, id_attribute), name)
+
+        if not channel:
+            channel = await create(name, category=category, overwrites=overwrites)
+        else:
+            changes = dict()
+            if channel.category != category:
+                changes['category'] = category
+            # Overwrites of other targets, e.g. members granted to speak, are kept
+            if any(channel.overwrites.get(target) != overwrite for target, overwrite in overwrites.items()):
+                changes['overwrites'] = {**channel.overwrites, **overwrites}
+            if changes:
+                await channel.edit(**changes)
+
+        setattr(self.config, id_attribute, channel.id)
+        return channel
+
+    async def provision(self, guild: Guild) -> Tuple[TextChannel, VoiceChannel]:
+        (admin_role, member_role), category = await asyncio.gather(self.define_roles(guild),
+                                                                    self.ensure_category(guild))
+        text_channel, voice_channel = await asyncio.gather(
+            self.ensure_channel(guild, 'text_channel_id', self.config.text_channel_name, guild.text_channels,
+                                guild.create_text_channel, category,
+                                self.text_overwrites(guild, admin_role, member_role)),
+            self.ensure_channel(guild, 'voice_channel_id', self.config.voice_channel_name, guild.voice_channels,
+                                guild.create_voice_channel, category,
+                                self.voice_overwrites(guild, admin_role, member_role)))
+        return text_channel, voice_channel
+
+    async def teardown(self, guild: Guild):
+        channels = [find(guild.get_channel, guild.text_channels, self.config.text_channel_id,
+                         self.config.text_channel_name),
+                    find(guild.get_channel, guild.voice_channels, self.config.voice_channel_id,
+                         self.config.voice_channel_name)]
+        await asyncio.gather(*[channel.delete() for channel in channels if channel])
+        self.config.text_channel_id = self.config.voice_channel_id = None
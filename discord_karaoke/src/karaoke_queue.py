@@ -0,0 +1,294 @@
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Iterator, Callable, Deque, Tuple
+
+from discord import User
+
+
+@dataclass
+class KaraokeQueueEntry:
+    user: User
+    comment: str = None
+    slot: int = 0
+    round: int = 0
+
+
+# Entries occupy growing slots, a Fenwick tree over the slots counts live entries:
+# position of an entry is a prefix sum and the n-th entry is a prefix search.
+class KaraokeQueue:
+    def __init__(self):
+        self._entries: Dict[int, KaraokeQueueEntry] = dict()
+        self._slots: List[Optional[KaraokeQueueEntry]] = []
+        self._tree: List[int] = [0]
+        self._head = 0
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def __contains__(self, user: User) -> bool:
+        return user.id in self._entries
+
+    def __iter__(self) -> Iterator[KaraokeQueueEntry]:
+        for slot in range(self._head, len(self._slots)):
+            entry = self._slots[slot]
+            if entry:
+                yield entry
+
+    def append(self, user: User, comment: str = None, song_round: int = None) -> int:
+        if len(self._slots) == len(self._tree) - 1:
+            self._rebuild(max(16, 2 * len(self._entries)))
+
+        entry = KaraokeQueueEntry(user, comment, len(self._slots), song_round or 0)
+        self._slots.append(entry)
+        self._entries[user.id] = entry
+        self._add(entry.slot, 1)
+        self.version += 1
+
+        return len(self._entries)
+
+    def count(self, user: User) -> int:
+        return 1 if user.id in self._entries else 0
+
+    def get(self, index: int) -> Optional[KaraokeQueueEntry]:
+        if not 0 <= index < len(self._entries):
+            return None
+        return self._slots[self._find(index + 1)]
+
+    def entry(self, user: User) -> Optional[KaraokeQueueEntry]:
+        return self._entries.get(user.id)
+
+    def index(self, user: User) -> int:
+        return self._prefix(self._entries[user.id].slot) - 1
+
+    def remove(self, user: User) -> KaraokeQueueEntry:
+        entry = self._entries.pop(user.id)
+        self._slots[entry.slot] = None
+        self._add(entry.slot, -1)
+        while self._head < len(self._slots) and not self._slots[self._head]:
+            self._head += 1
+        self.version += 1
+
+        return entry
+
+    def pop(self) -> KaraokeQueueEntry:
+        if not self._entries:
+            raise IndexError('pop from empty queue')
+        return self.remove(self._slots[self._head].user)
+
+    def pin(self):
+        # Later entries never overtake the head of a FIFO queue
+        pass
+
+    def clear(self):
+        self._entries.clear()
+        self._slots = []
+        self._tree = [0]
+        self._head = 0
+        self.version += 1
+
+    def _rebuild(self, capacity: int):
+        entries = [entry for entry in self]
+        size = 1
+        while size < capacity:
+            size *= 2
+
+        self._slots = entries
+        self._tree = [0] * (size + 1)
+        self._head = 0
+        for slot, entry in enumerate(entries):
+            entry.slot = slot
+            self._tree[slot + 1] = 1
+        for i in range(1, size):
+            self._tree[i + (i & -i)] += self._tree[i]
+
+    def _add(self, slot: int, delta: int):
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, slot: int) -> int:
+        i, total = slot + 1, 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _find(self, k: int) -> int:
+        position, step = 0, (len(self._tree) - 1)
+        while step:
+            if position + step < len(self._tree) and self._tree[position + step] < k:
+                position += step
+                k -= self._tree[position]
+            step //= 2
+        return position
+
+
+class KaraokeTreapNode:
+    __slots__ = ('key', 'entry', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, key: Tuple[int, int], entry: KaraokeQueueEntry):
+        self.key = key
+        self.entry = entry
+        self.priority = random.random()
+        self.size = 1
+        self.left: Optional[KaraokeTreapNode] = None
+        self.right: Optional[KaraokeTreapNode] = None
+
+    def update(self) -> 'KaraokeTreapNode':
+        self.size = 1 + (self.left.size if self.left else 0) + (self.right.size if self.right else 0)
+        return self
+
+
+def split(node: Optional[KaraokeTreapNode], key: Tuple[int, int]) -> Tuple[Optional[KaraokeTreapNode], ...]:
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = split(node.right, key)
+        return node.update(), right
+    left, node.left = split(node.left, key)
+    return left, node.update()
+
+
+def merge(left: Optional[KaraokeTreapNode], right: Optional[KaraokeTreapNode]) -> Optional[KaraokeTreapNode]:
+    if not left or not right:
+        return left or right
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return left.update()
+    right.left = merge(left, right.left)
+    return right.update()
+
+
+# Songs of several users ordered by round: the n-th pending song of a user is sung in a later round than the
+# (n-1)-th. A treap with subtree sizes keeps the order, so the next song, positions and removals are O(log n).
+class KaraokeFairQueue:
+    def __init__(self, weigh: Callable[[int], int] = None):
+        # Round a new song of the user starts from, the current round when not set (round robin)
+        self.weigh = weigh
+        self._root: Optional[KaraokeTreapNode] = None
+        self._songs: Dict[int, Deque[KaraokeQueueEntry]] = dict()
+        self._keys: Dict[int, Tuple[int, int]] = dict()
+        self._last_rounds: Dict[int, int] = dict()
+        self._round = 0
+        self._seq = 0
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._root.size if self._root else 0
+
+    def __bool__(self) -> bool:
+        return self._root is not None
+
+    def __contains__(self, user: User) -> bool:
+        return user.id in self._songs
+
+    def __iter__(self) -> Iterator[KaraokeQueueEntry]:
+        stack, node = [], self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.entry
+            node = node.right
+
+    def count(self, user: User) -> int:
+        return len(self._songs.get(user.id, ()))
+
+    def append(self, user: User, comment: str = None, song_round: int = None) -> int:
+        if song_round is None:
+            base = self.weigh(user.id) if self.weigh else self._round
+            last_round = self._last_rounds.get(user.id)
+            song_round = base if last_round is None else max(base, last_round + 1)
+        else:
+            # Restored songs keep their round, the earliest one is the current round
+            self._round = min(self._round, song_round) if self._root else song_round
+
+        entry = KaraokeQueueEntry(user, comment, self._seq, song_round)
+        self._seq += 1
+        self._songs.setdefault(user.id, deque()).append(entry)
+        self._last_rounds[user.id] = song_round
+        self._insert((song_round, entry.slot), entry)
+        self.version += 1
+
+        return self._rank(self._keys[entry.slot]) + 1
+
+    def get(self, index: int) -> Optional[KaraokeQueueEntry]:
+        if not 0 <= index < len(self):
+            return None
+
+        node = self._root
+        while True:
+            left = node.left.size if node.left else 0
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.entry
+            else:
+                index -= left + 1
+                node = node.right
+
+    def entry(self, user: User) -> Optional[KaraokeQueueEntry]:
+        songs = self._songs.get(user.id)
+        return songs[0] if songs else None
+
+    def index(self, user: User) -> int:
+        return self._rank(self._keys[self._songs[user.id][0].slot])
+
+    def remove(self, user: User) -> KaraokeQueueEntry:
+        songs = self._songs[user.id]
+        entry = songs.popleft()
+        if not songs:
+            del self._songs[user.id]
+        self._delete(self._keys.pop(entry.slot))
+        self.version += 1
+
+        return entry
+
+    def pop(self) -> KaraokeQueueEntry:
+        if not self._root:
+            raise IndexError('pop from empty queue')
+        entry = self.remove(self.get(0).user)
+        self._round = max(self._round, entry.round)
+        return entry
+
+    def pin(self):
+        # The song being performed stays at the head whatever is queued in an earlier round meanwhile
+        entry = self.get(0)
+        if entry and self._keys[entry.slot][0] >= 0:
+            self._delete(self._keys[entry.slot])
+            self._insert((-1, entry.slot), entry)
+
+    def clear(self):
+        self._root = None
+        self._songs.clear()
+        self._keys.clear()
+        self._last_rounds.clear()
+        self._round = 0
+        self.version += 1
+
+    def _insert(self, key: Tuple[int, int], entry: KaraokeQueueEntry):
+        self._keys[entry.slot] = key
+        left, right = split(self._root, key)
+        self._root = merge(merge(left, KaraokeTreapNode(key, entry)), right)
+
+    def _delete(self, key: Tuple[int, int]):
+        left, right = split(self._root, key)
+        _, right = split(right, (key[0], key[1] + 1))
+        self._root = merge(left, right)
+
+    def _rank(self, key: Tuple[int, int]) -> int:
+        node, rank = self._root, 0
+        while node:
+            if node.key < key:
+                rank += 1 + (node.left.size if node.left else 0)
+                node = node.right
+            else:
+                node = node.left
+        return rank
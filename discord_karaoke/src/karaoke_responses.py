@@ -0,0 +1,151 @@
+from string import Formatter
+from typing import Dict, Tuple, List, Union
+
+# Placeholders every response may use, a response can use any subset of them
+RESPONSE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'you_are_not_in_event': ('channel',),
+    'you_are_already_in_queue': ('index',),
+    'you_are_not_in_queue': (),
+    'you_are_added_in_queue_with_number': ('index',),
+    'you_have_reached_songs_limit': ('limit', 'index'),
+    'list_item': ('index', 'user', 'comment'),
+    'list_item_comment': ('comment',),
+    'list_delimiter': (),
+    'list_page': ('page', 'pages'),
+    'queue_is_empty_for_user': (),
+    'queue_is_empty_for_guild': (),
+    'current_artist': ('user', 'comment'),
+    'next_artist': ('user', 'comment'),
+    'artist_comment': ('comment',),
+    'user_not_in_queue': (),
+    'event_has_been_stopped': (),
+    'event_has_been_started': (),
+    'log_empty': (),
+    'start_artist_performance': ('user', 'comment'),
+    'your_performance_starts_now': (),
+    'skip_artist_performance': ('user', 'comment'),
+    'your_performance_is_skipped': ('user', 'comment'),
+    'skip_artist_performance_comment': ('comment',),
+    'next_artist_performance': ('user', 'comment'),
+    'next_performance_is_yours': (),
+    'finish_artist_performance': ('user', 'comment'),
+    'your_performance_is_finished': (),
+    'be_ready_artist_performance': ('user', 'comment'),
+    'you_have_to_be_ready_to_perform': (),
+    'you_are_ready': (),
+    'ready_is_not_expected': (),
+    'you_are_removed_from_queue': (),
+    'board_idle': (),
+    'board_queue': (),
+    'board_history': (),
+    'room_has_been_muted': (),
+    'room_has_been_unmuted': (),
+    'config_has_been_reloaded': (),
+    'config_reload_failed': ('error',),
+    'choose_event': ('events',),
+}
+
+# Responses added after the first release, configs written before them keep loading
+RESPONSE_DEFAULTS: Dict[str, str] = {
+    'you_have_reached_songs_limit': 'В очереди уже {limit} ваших песни. Ближайшая из них под номером {index}',
+    'list_page': '\n\nСтраница {page} из {pages}',
+    'you_are_ready': 'Отлично, ждём твоего выступления',
+    'ready_is_not_expected': 'Сейчас от вас не ждут подтверждения готовности',
+    'you_are_removed_from_queue': 'Вы вышли из комнаты ивента и удалены из очереди',
+    'board_idle': 'Сейчас никто не выступает',
+    'board_queue': '\n**Далее:**',
+    'board_history': '\n**Недавно выступали:**',
+    'room_has_been_muted': 'Микрофоны всех, кроме выступающего и админов, выключены',
+    'room_has_been_unmuted': 'Микрофоны возвращены',
+    'config_has_been_reloaded': 'Конфигурация перечитана',
+    'config_reload_failed': 'Не удалось перечитать конфигурацию, действует прежняя:\n{error}',
+    'choose_event': 'На сервере несколько ивентов, укажите нужный последним аргументом команды: {events}',
+}
+
+# A non-empty value of the field is rendered with the nested response, an empty one is omitted
+NESTED_RESPONSES: Dict[str, Dict[str, str]] = {
+    'list_item': {'comment': 'list_item_comment'},
+    'current_artist': {'comment': 'artist_comment'},
+    'next_artist': {'comment': 'artist_comment'},
+    'start_artist_performance': {'comment': 'artist_comment'},
+    'next_artist_performance': {'comment': 'artist_comment'},
+    'finish_artist_performance': {'comment': 'artist_comment'},
+    'be_ready_artist_performance': {'comment': 'artist_comment'},
+    'skip_artist_performance': {'comment': 'skip_artist_performance_comment'},
+    'your_performance_is_skipped': {'comment': 'skip_artist_performance_comment'},
+}
+
+CONVERSIONS = {'r': repr, 's': str, 'a': ascii}
+
+
+class KaraokeConfigError(ValueError):
+    pass
+
+
+class KaraokeTemplate:
+    __slots__ = ('key', 'parts', 'constant')
+
+    def __init__(self, key: str, source: str, fields: Tuple[str, ...], nested: Dict[str, 'KaraokeTemplate'] = None):
+        self.key = key
+        self.parts: List[Union[str, tuple]] = []
+        nested = nested or dict()
+
+        try:
+            parsed = list(Formatter().parse(source))
+        except ValueError as error:
+            raise KaraokeConfigError(f'responses.{key}: {error}')
+
+        for literal, field, spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if field not in fields:
+                expected = ', '.join('{' + name + '}' for name in fields) or 'no placeholders'
+                raise KaraokeConfigError(f'responses.{key}: unknown placeholder {{{field}}}, expected {expected}')
+            if conversion and conversion not in CONVERSIONS:
+                raise KaraokeConfigError(f'responses.{key}: unknown conversion !{conversion} of {{{field}}}')
+            self.parts.append((field, spec, CONVERSIONS.get(conversion), nested.get(field)))
+
+        self.constant = ''.join(self.parts) if all(isinstance(part, str) for part in self.parts) else None
+
+    def __call__(self, **values) -> str:
+        if self.constant is not None:
+            return self.constant
+
+        rendered = []
+        for part in self.parts:
+            if isinstance(part, str):
+                rendered.append(part)
+                continue
+
+            field, spec, conversion, nested = part
+            value = values[field]
+            if nested:
+                value = nested(**{field: value}) if value else ''
+            elif conversion:
+                value = conversion(value)
+            rendered.append(format(value, spec) if spec else str(value))
+        return ''.join(rendered)
+
+
+def compile_responses(responses: Dict[str, str]) -> Dict[str, KaraokeTemplate]:
+    errors = [f'responses.{key}: unknown response' for key in responses if key not in RESPONSE_FIELDS]
+    responses = {**RESPONSE_DEFAULTS, **responses}
+    # Only the responses of the first release have no default, every config has them
+    errors += [f'responses.{key}: missing response' for key in RESPONSE_FIELDS if key not in responses]
+
+    templates: Dict[str, KaraokeTemplate] = dict()
+    # Nested responses are compiled first to be embedded into the responses using them
+    for key in sorted(RESPONSE_FIELDS, key=lambda name: name in NESTED_RESPONSES):
+        if key not in responses:
+            continue
+        nested = {field: templates[name] for field, name in NESTED_RESPONSES.get(key, {}).items() if name in templates}
+        try:
+            templates[key] = KaraokeTemplate(key, responses[key], RESPONSE_FIELDS[key], nested)
+        except KaraokeConfigError as error:
+            errors.append(str(error))
+
+    if errors:
+        raise KaraokeConfigError('\n'.join(errors))
+    return templates
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Tuple, Callable, Iterable, Optional, List, Set
+
+import discord
+from discord import Member, Role
+
+from .karaoke_metrics import KaraokeMetrics
+
+logger = logging.getLogger(__name__)
+
+
+# Voice events only record the desired state of a member, the worker applies the net result once the member settles.
+# Members holding the role are saved to path, so the role of those who left while the bot was down is found without
+# loading all members of the guild.
+class KaraokeRoleSync:
+    def __init__(self, role: Callable[[], Optional[Role]], delay: float = 1.0, concurrency: int = 4,
+                 metrics: KaraokeMetrics = None, path: str = None):
+        self.role = role
+        self.path = path
+        self.delay = delay
+        self.concurrency = concurrency
+        self.metrics = metrics
+        self.pending: Dict[int, Tuple[Member, bool, float]] = dict()
+        # Whether the role was last given or taken by us, add_roles and remove_roles leave the cached member.roles
+        # as they were and only the members intent brings the change back
+        self.applied: Dict[int, bool] = dict()
+        self.applied_role: Optional[int] = None
+        self.saved: Optional[Set[int]] = None
+        self.save_lock: Optional[asyncio.Lock] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self.task:
+            self.wakeup = asyncio.Event()
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def schedule(self, member: Member, present: bool):
+        self.pending[member.id] = (member, present, time.monotonic() + self.delay)
+        if self.wakeup:
+            self.wakeup.set()
+
+    def holders(self, role: Role) -> Set[int]:
+        # Members the role was given to by the previous run, read once at the start
+        if self.path and self.saved is None and os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+            self.saved = set(saved['members'])
+            if saved['role'] == role.id:
+                self.applied_role = role.id
+                for member_id in saved['members']:
+                    self.applied.setdefault(member_id, True)
+        return {member_id for member_id, present in self.applied.items() if present}
+
+    def forget(self, member_ids: Iterable[int]):
+        # Members gone from the guild
+        for member_id in member_ids:
+            self.applied.pop(member_id, None)
+
+    def reconcile(self, voice_members: Iterable[Member], role_members: Iterable[Member]):
+        voice_members = {member.id: member for member in voice_members}
+        for member in role_members:
+            if member.id not in voice_members:
+                self.schedule(member, False)
+        for member in voice_members.values():
+            self.schedule(member, True)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            while self.pending:
+                now = time.monotonic()
+                due = [key for key, (_, _, due_at) in self.pending.items() if due_at <= now]
+                if not due:
+                    await asyncio.sleep(min(due_at for _, _, due_at in self.pending.values()) - now)
+                    continue
+
+                await self.apply_batch([self.pending.pop(key)[:2] for key in due])
+
+    async def flush(self):
+        batch = [(member, present) for member, present, _ in self.pending.values()]
+        self.pending.clear()
+        await self.apply_batch(batch)
+
+    async def apply_batch(self, batch: List[Tuple[Member, bool]]):
+        async def apply(member: Member, present: bool):
+            async with self.semaphore:
+                await self.apply(member, present)
+
+        await asyncio.gather(*[apply(member, present) for member, present in batch])
+        await self.save()
+
+    async def save(self):
+        if not self.path:
+            return
+        if not self.save_lock:
+            self.save_lock = asyncio.Lock()
+
+        async with self.save_lock:
+            holders = {member_id for member_id, present in self.applied.items() if present}
+            if holders == self.saved:
+                return
+            state = {'role': self.applied_role, 'members': sorted(holders)}
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.write, state)
+                self.saved = holders
+            except OSError as error:
+                logger.warning('Failed to save role members to %s: %s', self.path, error)
+
+    def write(self, state: dict):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temporary_path, self.path)
+
+    async def apply(self, member: Member, present: bool):
+        role = self.role()
+        if not role:
+            return
+
+        if self.applied_role != role.id:
+            self.applied.clear()
+            self.applied_role = role.id
+        has_role = self.applied.get(member.id)
+        if has_role is None:
+            has_role = role in member.roles
+        if has_role == present:
+            self.count('skip')
+            return
+
+        try:
+            if present:
+                await member.add_roles(role)
+            else:
+                await member.remove_roles(role)
+            self.applied[member.id] = present
+            self.count('add' if present else 'remove')
+        except discord.HTTPException as error:
+            logger.warning('Failed to sync role of %s: %s', member.id, error)
+            self.count('error')
+
+    def count(self, action: str):
+        if self.metrics:
+            self.metrics.inc('karaoke_role_sync_total', (('action', action),))
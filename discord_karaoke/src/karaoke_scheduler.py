@@ -0,0 +1,120 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Callable, Awaitable, Dict, Hashable, List, Tuple, Optional, Set
+
+from .karaoke_metrics import KaraokeMetrics
+
+logger = logging.getLogger(__name__)
+
+
+# Timers of the event on one heap served by a single task. Rescheduling or cancelling only replaces the timer of
+# the key, heap entries left behind by it are skipped when they come up.
+class KaraokeScheduler:
+    def __init__(self, resolution: float = 0.05, clock: Callable[[], float] = time.time,
+                 metrics: KaraokeMetrics = None):
+        # Timers fire up to one tick late, all of the tick together, the task wakes up once per tick and not per timer
+        self.resolution = resolution
+        # Wall clock by default, deadlines derived from journaled timestamps survive a restart
+        self.clock = clock
+        self.metrics = metrics
+        self.timers: Dict[Hashable, Tuple[float, int, Callable[..., Awaitable], tuple]] = dict()
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.seq = itertools.count()
+        self.running: Set[asyncio.Task] = set()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    def due(self, key: Hashable) -> Optional[float]:
+        timer = self.timers.get(key)
+        return timer[0] if timer else None
+
+    def schedule(self, key: Hashable, at: float, callback: Callable[..., Awaitable], *args):
+        timer = self.timers.get(key)
+        if timer and timer[0] == at and timer[2] == callback and timer[3] == args:
+            return
+
+        seq = next(self.seq)
+        self.timers[key] = (at, seq, callback, args)
+        heapq.heappush(self.heap, (at, seq, key))
+        if len(self.heap) > 2 * len(self.timers) + 64:
+            self.compact()
+
+        if not self.task:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        if self.heap[0][1] == seq:
+            self.wakeup.set()
+
+    def cancel(self, key: Hashable):
+        self.timers.pop(key, None)
+
+    def clear(self):
+        self.timers.clear()
+        self.heap.clear()
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for task in self.running:
+            task.cancel()
+
+    def compact(self):
+        self.heap = [(at, seq, key) for key, (at, seq, _, _) in self.timers.items()]
+        heapq.heapify(self.heap)
+
+    def next_at(self) -> Optional[float]:
+        while self.heap:
+            at, seq, key = self.heap[0]
+            timer = self.timers.get(key)
+            if timer and timer[1] == seq:
+                return at
+            heapq.heappop(self.heap)
+        return None
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            at = self.next_at()
+            if at is None:
+                await self.wakeup.wait()
+                continue
+
+            delay = at - self.clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay + self.resolution)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, key = heapq.heappop(self.heap)
+            _, _, callback, args = self.timers.pop(key)
+            # Callbacks wait for the actor and Discord, a slow one must not hold up the other timers
+            task = asyncio.ensure_future(self.fire(key, callback, args))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def fire(self, key: Hashable, callback: Callable[..., Awaitable], args: tuple):
+        timer = key[0] if isinstance(key, tuple) else key
+        try:
+            await callback(*args)
+            self.count(timer, 'fired')
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Timer %s failed', key)
+            self.count(timer, 'error')
+
+    def count(self, timer: str, result: str):
+        if self.metrics:
+            self.metrics.inc('karaoke_timers_total', (('timer', str(timer)), ('result', result)))
@@ -0,0 +1,71 @@
+import unittest
+
+from discord_karaoke.src.karaoke_actor import KaraokeActor
+from discord_karaoke.src.karaoke_metrics import KaraokeMetrics
+
+
+class KaraokeActorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.metrics = KaraokeMetrics()
+        self.state = []
+        self.actor = KaraokeActor(self.metrics)
+
+    async def asyncTearDown(self):
+        self.actor.stop()
+
+    def broken(self, message: str):
+        raise ValueError(message)
+
+    async def test_failed_operation_does_not_stop_the_actor(self):
+        with self.assertLogs('discord_karaoke.src.karaoke_actor', 'ERROR'):
+            with self.assertRaisesRegex(ValueError, 'broken'):
+                await self.actor.apply(self.broken, 'broken')
+        await self.actor.apply(self.state.append, 1)
+        self.assertEqual(self.state, [1])
+        self.assertEqual(self.metrics.counters['karaoke_actor_errors_total'][()], 1)
+
+    async def test_queued_operations_after_a_failure(self):
+        futures = [self.actor.submit(self.state.append, (1,), False),
+                   self.actor.submit(self.broken, ('broken',), False),
+                   self.actor.submit(self.state.append, (2,), False),
+                   self.actor.submit(len, (self.state,), True)]
+        with self.assertLogs('discord_karaoke.src.karaoke_actor', 'ERROR'):
+            for future in futures[:1]:
+                await future
+            with self.assertRaises(ValueError):
+                await futures[1]
+        await futures[2]
+        self.assertEqual(await futures[3], 2)
+
+    async def test_failed_change_handler(self):
+        changes = []
+
+        def on_change():
+            changes.append(len(self.state))
+            if len(changes) == 1:
+                raise RuntimeError('handler')
+
+        self.actor.on_change = on_change
+        with self.assertLogs('discord_karaoke.src.karaoke_actor', 'ERROR'):
+            await self.actor.apply(self.state.append, 1)
+        await self.actor.apply(self.state.append, 2)
+        self.assertEqual(changes, [1, 2])
+
+    async def test_unhashable_reads(self):
+        results = [self.actor.read(len, [1, 2]), self.actor.read(len, [1, 2, 3])]
+        self.assertEqual([await result for result in results], [2, 3])
+
+    async def test_identical_reads_are_coalesced(self):
+        calls = []
+
+        def read(value: int) -> int:
+            calls.append(value)
+            return value
+
+        futures = [self.actor.submit(read, (1,), True) for _ in range(3)]
+        self.assertEqual([await future for future in futures], [1, 1, 1])
+        self.assertEqual(calls, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
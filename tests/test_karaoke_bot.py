@@ -0,0 +1,154 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from benchmarks.fake_discord import FakeGateway, FakeGuild, FakeVoiceChannel
+from discord_karaoke.src.karaoke_bot import KaraokeBot
+from discord_karaoke.src.karaoke_bot_config import KaraokeBotConfig
+from discord_karaoke.src.karaoke_journal import KaraokeJournal
+from discord_karaoke.src.karaoke_notifier import KaraokeNotifier
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'config.json')
+
+
+# A tenant on the fake gateway, with the state in a temporary directory
+class KaraokeBotTestCase(unittest.IsolatedAsyncioTestCase):
+    queue_mode = 'fifo'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = KaraokeBotConfig.from_config_file(CONFIG_PATH)
+        self.config.storage_path = self.directory.name
+        self.config.metrics_port = None
+        self.config.queue_mode = self.queue_mode
+        self.gateway = FakeGateway(self.config)
+        self.tenants = []
+
+    async def asyncTearDown(self):
+        for tenant in self.tenants:
+            tenant.scheduler.stop()
+            tenant.role_sync.stop()
+            tenant.actor.stop()
+            if tenant.journal:
+                tenant.journal.close()
+        self.directory.cleanup()
+
+    def tenant(self) -> KaraokeBot:
+        tenant = KaraokeBot(self.config)
+        tenant.bot = self.gateway.bot
+        tenant.notifier = KaraokeNotifier(rate=10 ** 9, per=1)
+        self.tenants.append(tenant)
+        return tenant
+
+
+class KaraokeRestoreTest(KaraokeBotTestCase):
+    queue_mode = 'least_sung'
+
+    async def test_restored_performer_stays_first(self):
+        performer = self.gateway.add_member('performer')
+        journal = KaraokeJournal(self.config.storage_path)
+        journal.recover()
+        # Two songs sung already, the third one is performed in round 2 when the bot restarts
+        for song_round in range(2):
+            journal.append('add', performer.id, f'song {song_round}', song_round)
+            journal.append('pop', performer.id, 1.0, 2.0)
+        journal.append('add', performer.id, 'song 2', 2)
+        journal.append('perform', performer.id, time.time())
+        journal.close()
+
+        tenant = self.tenant()
+        await tenant.restore()
+        self.assertEqual(tenant.performance[0], performer.id)
+
+        newcomer = self.gateway.add_member('newcomer')
+        await tenant.actor.apply(tenant.add_to_queue, newcomer, 'first song')
+        self.assertLess(tenant.queue.entry(newcomer).round, tenant.queue.entry(performer).round)
+        self.assertEqual(tenant.queue.get(0).user, performer)
+
+        await tenant.actor.apply(tenant.end_performance)
+        self.assertEqual(tenant.log.recent(1)[0].user_id, performer.id)
+        self.assertEqual(tenant.queue.get(0).user, newcomer)
+        self.assertIsNone(tenant.performance)
+
+
+class KaraokeExpelTest(KaraokeBotTestCase):
+    async def test_expelled_performer_loses_speak_grant(self):
+        self.config.mic_mode = 'overwrites'
+        self.config.leave_grace = 0.05
+        tenant = self.tenant()
+        await tenant.on_ready()
+        admin = self.gateway.add_member('admin', admin=True)
+        await tenant.start_karaoke(self.gateway.text(admin))
+
+        performer = self.gateway.add_member('performer')
+        await tenant.on_voice_state_update(performer, *self.gateway.move(performer, self.gateway.voice_channel))
+        await tenant.add_me_to_queue(self.gateway.dm(performer), 'song')
+        await tenant.start_performance(self.gateway.text(admin))
+        self.assertIn(performer, self.gateway.voice_channel.overwrites)
+
+        await tenant.on_voice_state_update(performer, *self.gateway.move(performer, None))
+        await asyncio.sleep(self.config.leave_grace + 0.2)
+        self.assertNotIn(performer, tenant.queue)
+        self.assertNotIn(performer.id, tenant.mic.granted)
+        self.assertNotIn(performer, self.gateway.voice_channel.overwrites)
+
+
+class KaraokeRolesTest(KaraokeBotTestCase):
+    async def test_role_is_removed_after_leaving_while_down(self):
+        tenant = self.tenant()
+        await tenant.on_ready()
+        member = self.gateway.add_member('member')
+        await tenant.on_voice_state_update(member, *self.gateway.move(member, self.gateway.voice_channel))
+        await tenant.role_sync.flush()
+        self.assertIn(self.gateway.member_role, member.server_roles)
+        tenant.close()
+
+        # Left the voice channel while the bot was down, the cached roles never had the role
+        self.gateway.move(member, None)
+        self.assertNotIn(member, self.gateway.member_role.members)
+        tenant = self.tenant()
+        await tenant.on_ready()
+        await tenant.role_sync.flush()
+        self.assertNotIn(self.gateway.member_role, member.server_roles)
+        self.assertEqual(self.gateway.api.calls['remove_roles'], 1)
+
+    async def test_holders_gone_from_guild_are_forgotten(self):
+        tenant = self.tenant()
+        await tenant.on_ready()
+        member = self.gateway.add_member('member')
+        await tenant.on_voice_state_update(member, *self.gateway.move(member, self.gateway.voice_channel))
+        await tenant.role_sync.flush()
+        tenant.close()
+
+        self.gateway.guild.remove(member)
+        tenant = self.tenant()
+        await tenant.on_ready()
+        await tenant.role_sync.flush()
+        self.assertEqual(self.gateway.api.calls['fetch_member'], 1)
+        self.assertEqual(tenant.role_sync.holders(self.gateway.member_role), set())
+
+
+class KaraokeGuildOutageTest(KaraokeBotTestCase):
+    async def test_guild_objects_are_replaced_after_an_outage(self):
+        tenant = self.tenant()
+        await tenant.on_ready()
+        old_voice_channel = tenant.voice_channel
+        self.assertIs(old_voice_channel, self.gateway.voice_channel)
+
+        await tenant.on_guild_unavailable(self.gateway.guild)
+        # discord.py builds new objects for the guild once it is available again
+        guild = self.gateway.bot.guilds[self.config.guild_id] = FakeGuild(self.gateway.api, self.config.guild_id)
+        voice_channel = guild.add(FakeVoiceChannel(guild, self.config.voice_channel_name))
+        member = guild.add(self.gateway.add_member('member'))
+        self.gateway.move(member, voice_channel)
+        await tenant.on_guild_available(guild)
+
+        self.assertIs(tenant.guild, guild)
+        self.assertIs(tenant.voice_channel, voice_channel)
+        self.assertIn(member, tenant.participants)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import random
+import unittest
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from discord_karaoke.src.karaoke_queue import KaraokeFairQueue
+from tests.test_karaoke_queue import FakeUser
+
+
+# The rules of the fair queue on a plain list sorted on every read: songs go by round and then in the order they
+# were queued, the pinned head goes first
+class FairQueueModel:
+    def __init__(self, weigh: Callable[[int], int] = None):
+        self.weigh = weigh
+        self.songs: List[dict] = []
+        self.last_rounds: Dict[int, int] = dict()
+        self.round = 0
+        self.seq = 0
+
+    def ordered(self) -> List[dict]:
+        return sorted(self.songs, key=lambda song: (-1 if song['pinned'] else song['round'], song['seq']))
+
+    def first_of(self, user_id: int) -> Optional[dict]:
+        return min((song for song in self.songs if song['user'] == user_id), key=lambda song: song['seq'],
+                   default=None)
+
+    def append(self, user_id: int, comment: str, song_round: int = None) -> int:
+        if song_round is None:
+            base = self.weigh(user_id) if self.weigh else self.round
+            last_round = self.last_rounds.get(user_id)
+            song_round = base if last_round is None else max(base, last_round + 1)
+        else:
+            self.round = min(self.round, song_round) if self.songs else song_round
+
+        song = dict(user=user_id, comment=comment, round=song_round, seq=self.seq, pinned=False)
+        self.seq += 1
+        self.songs.append(song)
+        self.last_rounds[user_id] = song_round
+        return self.ordered().index(song) + 1
+
+    def remove(self, user_id: int) -> dict:
+        song = self.first_of(user_id)
+        self.songs.remove(song)
+        return song
+
+    def pop(self) -> dict:
+        song = self.ordered()[0]
+        self.songs.remove(song)
+        self.round = max(self.round, song['round'])
+        return song
+
+    def pin(self):
+        if self.songs:
+            self.ordered()[0]['pinned'] = True
+
+
+class KaraokeFairQueueTest(unittest.TestCase):
+    def check(self, queue: KaraokeFairQueue, model: FairQueueModel):
+        ordered = model.ordered()
+        self.assertEqual(len(queue), len(ordered))
+        self.assertEqual(bool(queue), bool(ordered))
+        self.assertEqual([(entry.user.id, entry.comment, entry.round) for entry in queue],
+                         [(song['user'], song['comment'], song['round']) for song in ordered])
+        for index, song in enumerate(ordered):
+            entry = queue.get(index)
+            self.assertEqual((entry.user.id, entry.comment), (song['user'], song['comment']))
+        self.assertIsNone(queue.get(len(ordered)))
+        self.assertIsNone(queue.get(-1))
+
+        for user_id, count in Counter(song['user'] for song in ordered).items():
+            first = model.first_of(user_id)
+            self.assertIn(FakeUser(user_id), queue)
+            self.assertEqual(queue.count(FakeUser(user_id)), count)
+            self.assertEqual(queue.index(FakeUser(user_id)), ordered.index(first))
+            self.assertEqual(queue.entry(FakeUser(user_id)).comment, first['comment'])
+
+    def run_random(self, seed: int, sung: Counter = None, restored: bool = False):
+        randomizer = random.Random(seed)
+        # Songs sung by the user, as the log counts them for least_sung
+        weigh = sung.__getitem__ if sung is not None else None
+        queue, model = KaraokeFairQueue(weigh), FairQueueModel(weigh)
+        users = [FakeUser(user_id) for user_id in range(30)]
+
+        if restored:
+            # A snapshot lists the songs in queue order, their rounds never go down
+            rounds = sorted(randomizer.randrange(3, 8) for _ in range(50))
+            for step, song_round in enumerate(rounds):
+                user = randomizer.choice(users)
+                self.assertEqual(queue.append(user, f'restored {step}', song_round),
+                                 model.append(user.id, f'restored {step}', song_round))
+            self.check(queue, model)
+
+        for step in range(2000):
+            operation = randomizer.random()
+            if operation < 0.45:
+                user = randomizer.choice(users)
+                self.assertEqual(queue.append(user, f'song {step}'), model.append(user.id, f'song {step}'))
+            elif operation < 0.65 and model.songs:
+                user_id = randomizer.choice(model.songs)['user']
+                entry, song = queue.remove(FakeUser(user_id)), model.remove(user_id)
+                self.assertEqual((entry.user.id, entry.comment, entry.round),
+                                 (song['user'], song['comment'], song['round']))
+            elif operation < 0.9 and model.songs:
+                entry, song = queue.pop(), model.pop()
+                self.assertEqual((entry.user.id, entry.comment), (song['user'], song['comment']))
+                if sung is not None:
+                    sung[entry.user.id] += 1
+            else:
+                queue.pin()
+                model.pin()
+            self.check(queue, model)
+
+    def test_round_robin(self):
+        self.run_random(1)
+
+    def test_weighed(self):
+        sung = Counter()
+        self.run_random(2, sung)
+        self.assertGreater(len(set(sung.values())), 1)
+
+    def test_least_sung_order(self):
+        sung = Counter({1: 2, 2: 1})
+        queue = KaraokeFairQueue(sung.__getitem__)
+        for user_id in (1, 2, 3):
+            queue.append(FakeUser(user_id), f'song of {user_id}')
+        # Whoever has sung more is queued later, whatever the order of queueing
+        self.assertEqual([entry.user.id for entry in queue], [3, 2, 1])
+        self.assertEqual([entry.round for entry in queue], [0, 1, 2])
+
+    def test_restored_rounds(self):
+        self.run_random(3, restored=True)
+
+    def test_round_robin_order(self):
+        queue = KaraokeFairQueue()
+        for user_id, comment in ((1, 'a1'), (1, 'a2'), (1, 'a3'), (2, 'b1'), (3, 'c1'), (2, 'b2')):
+            queue.append(FakeUser(user_id), comment)
+        self.assertEqual([entry.comment for entry in queue], ['a1', 'b1', 'c1', 'a2', 'b2', 'a3'])
+
+    def test_pinned_head_stays(self):
+        queue = KaraokeFairQueue()
+        queue.append(FakeUser(1), 'a1')
+        queue.append(FakeUser(1), 'a2')
+        queue.pin()
+        # A newcomer lands in round 0 before the second song of the first user but behind the performed song
+        queue.append(FakeUser(2), 'b1')
+        self.assertEqual([entry.comment for entry in queue], ['a1', 'b1', 'a2'])
+
+    def test_clear(self):
+        queue = KaraokeFairQueue()
+        queue.append(FakeUser(1), 'a1')
+        queue.append(FakeUser(1), 'a2')
+        queue.clear()
+        self.assertEqual(queue.append(FakeUser(1), 'a3'), 1)
+        self.assertEqual(queue.entry(FakeUser(1)).round, 0)
+
+    def test_pop_empty(self):
+        with self.assertRaises(IndexError):
+            KaraokeFairQueue().pop()
+
+
+if __name__ == '__main__':
+    unittest.main()
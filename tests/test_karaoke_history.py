@@ -0,0 +1,51 @@
+import unittest
+
+from discord_karaoke.src.karaoke_history import KaraokeHistory, FINISHED, SKIPPED
+
+
+class KaraokeHistoryTest(unittest.TestCase):
+    def test_count_only_finished(self):
+        history = KaraokeHistory()
+        history.append(1, 'sung', 1.0, 2.0)
+        history.append(1, 'skipped', None, 3.0, outcome=SKIPPED)
+        history.append(2, 'skipped', None, 4.0, outcome=SKIPPED)
+        self.assertEqual((history.count(1), history.count(2)), (1, 0))
+        self.assertEqual(len(history), 3)
+
+    def test_count_after_restore(self):
+        records = [(1, None, 1.0, 2.0, FINISHED), (1, None, None, 3.0, SKIPPED), (2, None, 4.0, 5.0, FINISHED)]
+        for capacity in (1, 10):
+            history = KaraokeHistory(capacity)
+            history.restore(records)
+            self.assertEqual((history.count(1), history.count(2)), (1, 1))
+            self.assertEqual(history.outcomes[SKIPPED], 1)
+
+
+    def test_average_duration(self):
+        history = KaraokeHistory()
+        self.assertIsNone(history.average_duration)
+        history.append(1, None, 10.0, 70.0)
+        history.append(2, None, 100.0, 220.0)
+        # Untimed skips don't count
+        history.append(3, None, None, 230.0, outcome=SKIPPED)
+        self.assertEqual(history.average_duration, 90.0)
+
+    def test_throughput_per_hour(self):
+        history = KaraokeHistory(capacity=2)
+        self.assertIsNone(history.throughput_per_hour)
+        history.append(1, None, 0.0, 600.0)
+        history.append(2, None, 600.0, 1200.0)
+        history.append(3, None, None, 1300.0, outcome=SKIPPED)
+        history.append(4, None, 1300.0, 1800.0)
+        # Three finished in the half an hour since the first start, the spilled one included
+        self.assertEqual(history.throughput_per_hour, 6.0)
+
+    def test_throughput_after_restore(self):
+        history = KaraokeHistory(capacity=1)
+        history.restore([(1, None, 0.0, 900.0, FINISHED), (2, None, 900.0, 1800.0, FINISHED)])
+        self.assertEqual(history.throughput_per_hour, 4.0)
+        self.assertEqual(history.average_duration, 900.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
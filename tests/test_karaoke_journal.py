@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+
+from discord_karaoke.src.karaoke_history import FINISHED, SKIPPED
+from discord_karaoke.src.karaoke_journal import KaraokeJournal, KaraokeJournalState
+
+
+class KaraokeJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def recover(self) -> KaraokeJournalState:
+        journal = KaraokeJournal(self.path)
+        state = journal.recover()
+        journal.close()
+        return state
+
+    def write(self, records, snapshot_every: int = 1000) -> KaraokeJournalState:
+        # Applies the records to a list queue and log as the bot does and snapshots them when the journal asks to
+        journal = KaraokeJournal(self.path, snapshot_every=snapshot_every)
+        state = journal.recover()
+        queue, log, performance = list(state.queue), list(state.log), state.performance
+        for op, *args in records:
+            journal.append(op, *args)
+            if op == 'add':
+                queue.append(tuple(args))
+            elif op in ('pop', 'skip', 'remove'):
+                song = next(song for song in queue if song[0] == args[0])
+                queue.remove(song)
+                if op != 'remove':
+                    log.append((song[0], song[1], *args[1:3], FINISHED if op == 'pop' else SKIPPED))
+                if performance and performance[0] == args[0]:
+                    performance = None
+            elif op == 'perform':
+                performance = tuple(args)
+            elif op == 'clear':
+                queue, log, performance = [], [], None
+            if journal.needs_snapshot:
+                journal.snapshot(KaraokeJournalState(list(queue), list(log), performance))
+        journal.close()
+        return KaraokeJournalState(queue, log, performance)
+
+    def assertRecovered(self, expected: KaraokeJournalState):
+        state = self.recover()
+        self.assertEqual([tuple(song) for song in state.queue], expected.queue)
+        self.assertEqual([tuple(record) for record in state.log], expected.log)
+        self.assertEqual(state.performance, expected.performance)
+
+    def records(self, users: int):
+        for user_id in range(users):
+            yield 'add', user_id, f'song {user_id}', user_id // 3
+        for user_id in range(0, users, 4):
+            yield 'perform', user_id, 100.0 + user_id
+            yield 'pop', user_id, 100.0 + user_id, 200.0 + user_id
+        for user_id in range(1, users, 4):
+            yield 'skip', user_id, None, 300.0 + user_id
+        for user_id in range(2, users, 4):
+            yield 'remove', user_id
+        yield 'add', 0, 'encore', 9
+        yield 'perform', 3, 400.0
+
+    def test_round_trip_without_snapshot(self):
+        expected = self.write(self.records(20))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'snapshot.json')))
+        self.assertRecovered(expected)
+
+    def test_round_trip_with_snapshots(self):
+        expected = self.write(self.records(40), snapshot_every=7)
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'snapshot.json')))
+        self.assertRecovered(expected)
+        # The journal only keeps the records written after the last snapshot
+        with open(os.path.join(self.path, 'journal.jsonl'), encoding='utf-8') as f:
+            self.assertLess(len(f.readlines()), 7)
+
+    def test_appends_after_recovery(self):
+        self.write(self.records(10), snapshot_every=4)
+        expected = self.write([('add', 100, 'later', 0), ('pop', 3, 1.0, 2.0)], snapshot_every=4)
+        self.assertRecovered(expected)
+
+    def test_performance_ends_with_its_song(self):
+        expected = self.write([('add', 1, None, 0), ('add', 2, None, 0), ('perform', 1, 5.0), ('remove', 1)])
+        self.assertIsNone(expected.performance)
+        self.assertRecovered(expected)
+
+    def test_clear(self):
+        self.write(self.records(10))
+        expected = self.write([('clear',), ('add', 5, 'after clear', 0)])
+        self.assertRecovered(expected)
+
+    def test_torn_record_is_dropped(self):
+        expected = self.write(self.records(10))
+        journal_path = os.path.join(self.path, 'journal.jsonl')
+        with open(journal_path, 'a', encoding='utf-8') as f:
+            f.write('[1000, "add", 77')
+        self.assertRecovered(expected)
+        with open(journal_path, encoding='utf-8') as f:
+            self.assertTrue(f.read().endswith('\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import logging
+import types
+import unittest
+
+from discord_karaoke.src.karaoke_metrics import KaraokeMetrics, KaraokeRateLimitLog
+
+WAITS = 'karaoke_rate_limit_wait_seconds_total'
+
+
+# Messages as discord.http 1.7.3 logs them
+class KaraokeRateLimitLogTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = KaraokeMetrics()
+        self.logger = logging.getLogger('tests.discord.http')
+        self.logger.setLevel(logging.WARNING)
+        self.module = types.SimpleNamespace(log=self.logger)
+        self.log = KaraokeRateLimitLog.install(self.metrics, self.module)
+
+    def waits(self, source: str) -> float:
+        return self.metrics.counters.get(WAITS, {}).get((('source', source),), 0)
+
+    def test_exhausted_bucket_at_debug_level(self):
+        # Counted though the logger drops debug records
+        self.module.log.debug('A rate limit bucket has been exhausted (bucket: %s, retry: %s).', 'bucket', 1.5)
+        self.assertFalse(self.logger.isEnabledFor(logging.DEBUG))
+        self.assertEqual(self.waits('http'), 1.5)
+
+    def test_rate_limited_response(self):
+        with self.assertLogs(self.logger, logging.WARNING) as logs:
+            self.module.log.warning('We are being rate limited. Retrying in %.2f seconds. Handled under the bucket '
+                                    '"%s"', 2.25, 'bucket')
+        self.assertEqual(self.waits('http'), 2.25)
+        self.assertIn('Retrying in 2.25 seconds', logs.output[0])
+
+    def test_global_rate_limit(self):
+        with self.assertLogs(self.logger, logging.WARNING):
+            self.module.log.warning('Global rate limit has been hit. Retrying in %.2f seconds.', 3.0)
+        self.assertEqual(self.waits('global'), 3.0)
+        self.assertEqual(self.waits('http'), 0)
+
+    def test_other_messages(self):
+        self.module.log.debug('%s %s has received %s', 'GET', 'url', {})
+        self.assertNotIn(WAITS, self.metrics.counters)
+
+    def test_install_twice(self):
+        KaraokeRateLimitLog.install(self.metrics, self.module)
+        self.assertIs(self.module.log.logger, self.logger)
+        self.module.log.debug('A rate limit bucket has been exhausted (bucket: %s, retry: %s).', 'bucket', 1.0)
+        self.assertEqual(self.waits('http'), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
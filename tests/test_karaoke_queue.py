@@ -0,0 +1,85 @@
+import random
+import unittest
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from discord_karaoke.src.karaoke_queue import KaraokeQueue
+
+
+@dataclass(frozen=True)
+class FakeUser:
+    id: int
+
+
+# Random appends, removals and pops compared with a plain list of (user id, comment), enough of them to grow and
+# rebuild the slots and the tree a few times
+class KaraokeQueueTest(unittest.TestCase):
+    def check(self, queue: KaraokeQueue, model: List[Tuple[int, str]]):
+        self.assertEqual(len(queue), len(model))
+        self.assertEqual(bool(queue), bool(model))
+        self.assertEqual([(entry.user.id, entry.comment) for entry in queue], model)
+        for index, (user_id, comment) in enumerate(model):
+            entry = queue.get(index)
+            self.assertEqual((entry.user.id, entry.comment), (user_id, comment))
+            self.assertEqual(queue.index(FakeUser(user_id)), index)
+            self.assertIn(FakeUser(user_id), queue)
+            self.assertEqual(queue.count(FakeUser(user_id)), 1)
+        self.assertIsNone(queue.get(len(model)))
+        self.assertIsNone(queue.get(-1))
+
+    def test_matches_list(self):
+        randomizer = random.Random(1)
+        queue, model = KaraokeQueue(), []
+        users = [FakeUser(user_id) for user_id in range(200)]
+
+        for step in range(3000):
+            operation = randomizer.random()
+            queued = {user_id for user_id, _ in model}
+            free = [user for user in users if user.id not in queued]
+            if operation < 0.5 and free:
+                user = randomizer.choice(free)
+                self.assertEqual(queue.append(user, f'song {step}'), len(model) + 1)
+                model.append((user.id, f'song {step}'))
+            elif operation < 0.75 and model:
+                user_id, comment = model.pop(randomizer.randrange(len(model)))
+                entry = queue.remove(FakeUser(user_id))
+                self.assertEqual((entry.user.id, entry.comment), (user_id, comment))
+                self.assertNotIn(FakeUser(user_id), queue)
+                self.assertEqual(queue.count(FakeUser(user_id)), 0)
+            elif operation < 0.95 and model:
+                entry = queue.pop()
+                self.assertEqual((entry.user.id, entry.comment), model.pop(0))
+            else:
+                queue.pin()
+            self.check(queue, model)
+
+    def test_pop_empty(self):
+        queue = KaraokeQueue()
+        queue.append(FakeUser(1))
+        queue.pop()
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+    def test_version_changes_with_queue(self):
+        queue = KaraokeQueue()
+        versions = [queue.version]
+        queue.append(FakeUser(1))
+        versions.append(queue.version)
+        queue.append(FakeUser(2))
+        versions.append(queue.version)
+        queue.remove(FakeUser(1))
+        versions.append(queue.version)
+        queue.clear()
+        versions.append(queue.version)
+        self.assertEqual(len(set(versions)), len(versions))
+        self.check(queue, [])
+
+    def test_round_is_kept(self):
+        queue = KaraokeQueue()
+        queue.append(FakeUser(1), 'song', 3)
+        queue.append(FakeUser(2))
+        self.assertEqual([entry.round for entry in queue], [3, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import os
+import unittest
+from typing import Dict
+
+from discord_karaoke.src.karaoke_responses import KaraokeTemplate, KaraokeConfigError, RESPONSE_FIELDS, \
+    RESPONSE_DEFAULTS, compile_responses
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'config.json')
+
+
+def config_responses() -> Dict[str, str]:
+    with open(CONFIG_PATH, encoding='utf-8') as f:
+        return json.load(f)['responses']
+
+
+class KaraokeTemplateTest(unittest.TestCase):
+    def test_renders_as_format(self):
+        source = '{index:>3}. {user!r} {user} {{literal}} {index:03d}'
+        template = KaraokeTemplate('test', source, ('index', 'user'))
+        self.assertEqual(template(index=7, user='artist'), source.format(index=7, user='artist'))
+
+    def test_constant(self):
+        template = KaraokeTemplate('test', 'no placeholders {{here}}', ())
+        self.assertEqual(template.constant, 'no placeholders {here}')
+        self.assertEqual(template(unused=1), 'no placeholders {here}')
+
+    def test_unused_fields(self):
+        self.assertEqual(KaraokeTemplate('test', '{user}', ('index', 'user'))(index=1, user='a'), 'a')
+
+    def test_nested_is_omitted_when_empty(self):
+        nested = KaraokeTemplate('nested', ' - {comment}', ('comment',))
+        template = KaraokeTemplate('test', '{user}{comment}', ('user', 'comment'), {'comment': nested})
+        self.assertEqual(template(user='a', comment='song'), 'a - song')
+        self.assertEqual(template(user='a', comment=None), 'a')
+        self.assertEqual(template(user='a', comment=''), 'a')
+
+    def test_unknown_placeholder(self):
+        with self.assertRaisesRegex(KaraokeConfigError, r'responses\.test: unknown placeholder \{name\}'):
+            KaraokeTemplate('test', '{name}', ('user',))
+
+    def test_unknown_conversion(self):
+        with self.assertRaisesRegex(KaraokeConfigError, r'unknown conversion !x'):
+            KaraokeTemplate('test', '{user!x}', ('user',))
+
+    def test_syntax_error(self):
+        with self.assertRaisesRegex(KaraokeConfigError, r'responses\.test: '):
+            KaraokeTemplate('test', '{user', ('user',))
+
+
+class CompileResponsesTest(unittest.TestCase):
+    def test_config(self):
+        responses = config_responses()
+        templates = compile_responses(responses)
+        self.assertEqual(set(templates), set(RESPONSE_FIELDS))
+        self.assertEqual(templates['list_item'](index=1, user='<@1>', comment='song'),
+                         responses['list_item'].format(index=1, user='<@1>', comment='') +
+                         responses['list_item_comment'].format(comment='song'))
+
+    def test_defaults_fill_older_configs(self):
+        responses = {key: value for key, value in config_responses().items() if key not in RESPONSE_DEFAULTS}
+        templates = compile_responses(responses)
+        self.assertEqual(set(templates), set(RESPONSE_FIELDS))
+        self.assertEqual(templates['list_page'](page=1, pages=2),
+                         RESPONSE_DEFAULTS['list_page'].format(page=1, pages=2))
+
+    def test_errors_are_collected(self):
+        responses = config_responses()
+        del responses['list_item']
+        responses['unknown_key'] = 'text'
+        responses['current_artist'] = '{name}'
+        with self.assertRaises(KaraokeConfigError) as context:
+            compile_responses(responses)
+        errors = str(context.exception).split('\n')
+        self.assertIn('responses.unknown_key: unknown response', errors)
+        self.assertIn('responses.list_item: missing response', errors)
+        self.assertTrue(any(error.startswith('responses.current_artist: unknown placeholder') for error in errors))
+
+
+if __name__ == '__main__':
+    unittest.main()
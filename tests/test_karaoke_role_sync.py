@@ -0,0 +1,56 @@
+import os
+import unittest
+
+from benchmarks.fake_discord import FakeGateway
+from discord_karaoke.src.karaoke_bot_config import KaraokeBotConfig
+from discord_karaoke.src.karaoke_role_sync import KaraokeRoleSync
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'config.json')
+
+
+class KaraokeRoleSyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.gateway = FakeGateway(KaraokeBotConfig.from_config_file(CONFIG_PATH))
+        self.role = self.gateway.member_role
+        self.sync = KaraokeRoleSync(lambda: self.role, delay=0)
+        self.sync.start()
+
+    def tearDown(self):
+        self.sync.stop()
+
+    async def test_join_and_leave_with_stale_cache(self):
+        member = self.gateway.add_member('member')
+        for _ in range(2):
+            self.sync.schedule(member, True)
+            await self.sync.flush()
+            self.assertIn(self.role, member.server_roles)
+            self.sync.schedule(member, False)
+            await self.sync.flush()
+            self.assertNotIn(self.role, member.server_roles)
+        # The cache never saw the changes
+        self.assertNotIn(self.role, member.roles)
+        self.assertEqual((self.gateway.api.calls['add_roles'], self.gateway.api.calls['remove_roles']), (2, 2))
+
+    async def test_repeated_state_is_skipped(self):
+        member = self.gateway.add_member('member')
+        for _ in range(3):
+            self.sync.schedule(member, True)
+            await self.sync.flush()
+        self.sync.schedule(member, False)
+        await self.sync.flush()
+        self.sync.schedule(member, False)
+        await self.sync.flush()
+        self.assertEqual((self.gateway.api.calls['add_roles'], self.gateway.api.calls['remove_roles']), (1, 1))
+
+    async def test_cached_role_is_removed(self):
+        # Held the role before the start, as seen in the member cache
+        member = self.gateway.add_member('member')
+        member.roles.append(self.role)
+        member.server_roles.append(self.role)
+        self.sync.reconcile([], [member])
+        await self.sync.flush()
+        self.assertNotIn(self.role, member.server_roles)
+
+
+if __name__ == '__main__':
+    unittest.main()